@@ -126,7 +126,59 @@ LOGIN_URL = "maps:login"
 LOGIN_REDIRECT_URL = "maps:utils_index"
 
 
+# Cached data is versioned by Trip.cache_version, so it never gets stale,
+# timeouts expire the versions superseded by a change of the trip
 GEOJSON_CACHE_TIMEOUTS = {
-    "ongoing_trip": 3600,  # 1 hour
-    "past_trip": 86400,   # 1 day
-}
\ No newline at end of file
+    "ongoing_trip": 86400,  # 1 day
+    "past_trip": 2419200,  # 4 weeks, past trips rarely change
+    "feature": 604800,  # 1 week, single track feature
+}
+
+
+# Levels of detail for the map GeoJSON, ordered from the coarsest to the finest.
+# Value is the ST_SimplifyPreserveTopology tolerance in degrees,
+# None means full resolution.
+GEOJSON_DETAIL_LEVELS = {
+    "low": 0.01,
+    "medium": 0.001,
+    "high": None,
+}
+
+# Decimal places of the map GeoJSON coordinates, 5 is about one meter
+GEOJSON_COORDINATE_PRECISION = 5
+
+# Where the map GeoJSON is built: "python" or "database" (PostGIS json_agg)
+GEOJSON_GENERATION = "python"
+
+
+# Only one worker rebuilds a missing map GeoJSON, the others get the previous
+# version or wait for it. Requests still waiting after "wait" get 503 with
+# Retry-After. Larger beta refreshes the cache earlier before expiry.
+GEOJSON_REBUILD = {
+    "lock_timeout": 60,  # seconds
+    "wait": 3,  # seconds
+    "poll_interval": 0.1,  # seconds
+    "retry_after": 5,  # seconds
+    "beta": 1.0,
+}
+
+
+# Limits of bbox.geojson of all trips, so one request can't serialize every track.
+# max_area is in square degrees.
+BBOX_LIMITS = {"max_area": 400, "max_tracks": 500}
+
+
+# Trips with more tracks than this draw their paths from vector tiles
+MVT_TRACKS_THRESHOLD = 100
+
+
+# Pool parsing track files in TracksService: "process" or "thread".
+# fitdecode and lxml hold the GIL while parsing,
+# so only processes scale with cores;
+# workers None means the number of CPUs, 1 parses in the calling process.
+TRACKS_PARSE_POOL = {"executor": "process", "workers": None}
+TRACKS_BULK_SIZE = 100
+
+
+# Points of the elevation and speed profiles after LTTB downsampling
+PROFILE_POINTS = {"default": 500, "max": 5000}
@@ -90,6 +90,10 @@ LOGGING = {
 }
 
 
+# Build the map GeoJSON in PostGIS
+GEOJSON_GENERATION = "database"
+
+
 # Cache settings with Redis
 CACHES = {
     "default": {
@@ -17,6 +17,10 @@ CACHES = {
 }
 
 
+# mocked parsers are visible to threads only
+TRACKS_PARSE_POOL = {"executor": "thread", "workers": 2}
+
+
 TEMPLATES[0]["OPTIONS"]["loaders"] = [
     [
         "django.template.loaders.cached.Loader",
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class MapsConfig(AppConfig):
     name = "project.maps"
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,55 @@
+import time
+
+import numpy as np
+import orjson
+from django.contrib.gis.geos import LineString
+from django.core.management.base import BaseCommand
+
+from ...utils.views_map import path_array
+
+
+def create_path(vertices):
+    # random walk around Vilnius, roughly a GPS track
+    steps = np.random.default_rng(0).normal(scale=0.0001, size=(vertices, 2))
+    return LineString(np.cumsum(steps, axis=0) + (25.28, 54.69), srid=4326)
+
+
+def serialize_tuples(path):
+    return orjson.dumps({"coordinates": path.coords})
+
+
+def serialize_array(path):
+    return orjson.dumps(
+        {"coordinates": path_array(path)}, option=orjson.OPT_SERIALIZE_NUMPY
+    )
+
+
+def best_of(func, path, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(path)
+        times.append(time.perf_counter() - started)
+
+    return min(times)
+
+
+class Command(BaseCommand):
+    help = "Compare GeoJSON coordinates serialization of GEOS tuples and numpy"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vertices", type=int, default=1_000_000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        path = create_path(options["vertices"])
+
+        tuples = best_of(serialize_tuples, path, options["repeat"])
+        array = best_of(serialize_array, path, options["repeat"])
+
+        self.stdout.write(
+            f"{options['vertices']} vertices, best of {options['repeat']}"
+        )
+        self.stdout.write(f"GEOS tuples: {tuples:.3f} sec")
+        self.stdout.write(f"numpy array: {array:.3f} sec")
+        self.stdout.write(self.style.SUCCESS(f"speedup: {tuples / array:.1f}x"))
@@ -0,0 +1,41 @@
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import models
+from ...utils.freeze_service import freeze_trip, is_frozen
+
+
+class Command(BaseCommand):
+    help = "Write GeoJSON of finished trips into static files"
+
+    def add_arguments(self, parser):
+        parser.add_argument("trips", nargs="*", help="Trip slugs, all trips if empty")
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rewrite files of trips already frozen at their current version",
+        )
+
+    def handle(self, *args, **options):
+        trips = models.Trip.objects.filter(end_date__lt=date.today())
+        if options["trips"]:
+            trips = trips.filter(slug__in=options["trips"])
+
+        qty = 0
+        for trip in trips:
+            if is_frozen(trip) and not options["force"]:
+                continue
+
+            try:
+                frozen = freeze_trip(trip)
+            except Exception as e:
+                raise CommandError(f"Can't freeze {trip.title} - {e}") from e
+
+            if frozen:
+                qty += 1
+                self.stdout.write(f"{trip.slug}: frozen at v{trip.cache_version}")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"{datetime.now()}: {qty} trips have been frozen.")
+        )
@@ -3,7 +3,7 @@ from datetime import datetime
 from django.core.management.base import BaseCommand, CommandError
 
 from ...utils.tracks_service import TracksService, TracksServiceData
-from ...utils.views_map import set_cache
+from ...utils.views_map import refresh_cache
 
 
 class Command(BaseCommand):
@@ -23,7 +23,7 @@ class Command(BaseCommand):
         # set cache after writing to DB
         if track_qty > 0:
             try:
-                set_cache(obj.trip)
+                refresh_cache(obj.trip)
             except Exception as e:
                 raise CommandError(f"Can't set cache - {e}") from e
 
@@ -0,0 +1,91 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ... import models
+from ...utils.common import is_finished
+from ...utils.views_map import is_cached, warm_cache
+
+MAX_WORKERS = 16
+
+
+def warm_trip(trip, force=False):
+    """
+    Returns seconds spent on the trip's cache or None if it was up to date.
+    """
+    try:
+        if not force and is_finished(trip) and is_cached(trip):
+            return None
+
+        started = time.perf_counter()
+        warm_cache(trip)
+
+        return time.perf_counter() - started
+    finally:
+        # every worker thread opens its own database connection
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Rebuild GeoJSON and statistic caches of trips"
+
+    def add_arguments(self, parser):
+        parser.add_argument("trips", nargs="*", help="Trip slugs, all trips if empty")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help=f"Trips rebuilt at the same time, 1-{MAX_WORKERS}",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rebuild finished trips even if their cache is up to date",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        if not 1 <= workers <= MAX_WORKERS:
+            raise CommandError(f"--workers must be between 1 and {MAX_WORKERS}")
+
+        trips = models.Trip.objects.order_by("start_date")
+        if options["trips"]:
+            trips = trips.filter(slug__in=options["trips"])
+
+        started = time.perf_counter()
+        failed = 0
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(warm_trip, trip, options["force"]): trip
+                for trip in trips
+            }
+
+            for future in as_completed(futures):
+                trip = futures[future]
+
+                try:
+                    elapsed = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{trip.slug}: can't set cache - {e}")
+                    continue
+
+                if elapsed is None:
+                    self.stdout.write(f"{trip.slug}: up to date, skipped")
+                else:
+                    self.stdout.write(f"{trip.slug}: {elapsed:.2f} sec")
+
+        total = time.perf_counter() - started
+        if failed:
+            raise CommandError(f"{failed} of {len(futures)} trips failed")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{datetime.now()}: warmed cache of {len(futures)} trips "
+                f"in {total:.2f} sec"
+            )
+        )
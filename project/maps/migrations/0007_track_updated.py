@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0006_alter_trip_blog_category"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="track",
+            name="updated",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+    ]
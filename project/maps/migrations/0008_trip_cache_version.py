@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0007_track_updated"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trip",
+            name="cache_version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="tracks_updated",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
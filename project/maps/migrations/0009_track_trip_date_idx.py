@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0008_trip_cache_version"),
+    ]
+
+    operations = [
+        # GiST index on maps_track.path exists since 0002_track_path
+        migrations.AddIndex(
+            model_name="track",
+            index=models.Index(fields=["trip", "date"], name="track_trip_date_idx"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0009_track_trip_date_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trip",
+            name="frozen_version",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0010_trip_frozen_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TripStatistic",
+            fields=[
+                (
+                    "trip",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="totals",
+                        serialize=False,
+                        to="maps.trip",
+                    ),
+                ),
+                ("total_km", models.FloatField(default=0)),
+                ("total_time_seconds", models.FloatField(default=0)),
+                ("ascent", models.FloatField(default=0)),
+                ("descent", models.FloatField(default=0)),
+                ("track_count", models.PositiveIntegerField(default=0)),
+                ("max_speed", models.FloatField(blank=True, null=True)),
+                ("first_date", models.DateTimeField(blank=True, null=True)),
+                ("last_date", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
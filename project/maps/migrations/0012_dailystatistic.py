@@ -0,0 +1,50 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0011_tripstatistic"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyStatistic",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("total_km", models.FloatField(default=0)),
+                ("total_time_seconds", models.FloatField(default=0)),
+                ("ascent", models.FloatField(default=0)),
+                ("descent", models.FloatField(default=0)),
+                ("track_count", models.PositiveIntegerField(default=0)),
+                ("max_speed", models.FloatField(blank=True, null=True)),
+                (
+                    "trip",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="days",
+                        to="maps.trip",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["date"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("trip", "date"), name="dailystatistic_trip_date_uniq"
+                    )
+                ],
+            },
+        ),
+    ]
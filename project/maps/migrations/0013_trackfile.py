@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0012_dailystatistic"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrackFile",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=254)),
+                ("size", models.BigIntegerField()),
+                ("mtime", models.FloatField()),
+                ("sha256", models.CharField(max_length=64)),
+                ("parser_version", models.PositiveSmallIntegerField()),
+                (
+                    "trip",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="track_files",
+                        to="maps.trip",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("trip", "name"), name="trackfile_trip_name_uniq"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0013_trackfile"),
+    ]
+
+    operations = [
+        # keep the latest of the tracks imported twice, before the constraint,
+        # statistics go first, their foreign key doesn't cascade in the database
+        migrations.RunSQL(
+            sql=[
+                """
+                DELETE FROM maps_statistic s
+                USING maps_track a, maps_track b
+                WHERE s.track_id = a.id
+                    AND a.trip_id = b.trip_id AND a.title = b.title AND a.id < b.id
+                """,
+                """
+                DELETE FROM maps_track a
+                USING maps_track b
+                WHERE a.trip_id = b.trip_id AND a.title = b.title AND a.id < b.id
+                """,
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name="track",
+            constraint=models.UniqueConstraint(
+                fields=["trip", "title"], name="track_trip_title_uniq"
+            ),
+        ),
+    ]
@@ -1,16 +1,32 @@
 from bulk_update_or_create import BulkUpdateOrCreateQuerySet
 from django.contrib.gis.db import models
+from django.db.models import F
 from django.urls import reverse_lazy
+from django.utils import timezone
 from django.utils.text import slugify
 
 
+class TripQuerySet(models.QuerySet):
+    def bump_cache_version(self):
+        """Invalidates cached GeoJSON, tiles and statistics of the trips."""
+        return self.update(
+            cache_version=F("cache_version") + 1, tracks_updated=timezone.now()
+        )
+
+
 class Trip(models.Model):
+    objects = TripQuerySet.as_manager()
+
     title = models.CharField(max_length=254)
     slug = models.SlugField(editable=False)
     description = models.TextField(blank=True, null=True)
     start_date = models.DateField()
     end_date = models.DateField()
     blog_category = models.SmallIntegerField()
+    cache_version = models.PositiveIntegerField(default=0, editable=False)
+    tracks_updated = models.DateTimeField(null=True, blank=True, editable=False)
+    # cache_version written to static GeoJSON files, see freeze_service
+    frozen_version = models.PositiveIntegerField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = [
@@ -55,6 +71,10 @@ class Trip(models.Model):
     def get_absolute_url(self):
         return reverse_lazy("maps:update_trip", kwargs={"pk": self.pk})
 
+    def bump_cache_version(self):
+        Trip.objects.filter(pk=self.pk).bump_cache_version()
+        self.refresh_from_db(fields=["cache_version", "tracks_updated"])
+
 
 class CommentQty(models.Model):
     objects = BulkUpdateOrCreateQuerySet.as_manager()
@@ -89,6 +109,7 @@ class Track(models.Model):
         max_length=30,
     )
     path = models.LineStringField(srid=4326, null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
 
     trip = models.ForeignKey(
         Trip,
@@ -100,6 +121,14 @@ class Track(models.Model):
         ordering = [
             "-date",
         ]
+        indexes = [
+            models.Index(fields=["trip", "date"], name="track_trip_date_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["trip", "title"], name="track_trip_title_uniq"
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -121,3 +150,58 @@ class Statistic(models.Model):
     avg_temperature = models.FloatField(null=True, blank=True)
 
     track = models.OneToOneField(Track, related_name="stats", on_delete=models.CASCADE)
+
+
+class TripStatistic(models.Model):
+    """Totals of the trip's track statistics, kept up to date on ingest."""
+
+    trip = models.OneToOneField(
+        Trip, related_name="totals", on_delete=models.CASCADE, primary_key=True
+    )
+    total_km = models.FloatField(default=0)
+    total_time_seconds = models.FloatField(default=0)
+    ascent = models.FloatField(default=0)
+    descent = models.FloatField(default=0)
+    track_count = models.PositiveIntegerField(default=0)
+    max_speed = models.FloatField(null=True, blank=True)
+    first_date = models.DateTimeField(null=True, blank=True)
+    last_date = models.DateTimeField(null=True, blank=True)
+
+
+class DailyStatistic(models.Model):
+    """Totals of the trip's track statistics per local (TIME_ZONE) date."""
+
+    trip = models.ForeignKey(Trip, related_name="days", on_delete=models.CASCADE)
+    date = models.DateField()
+    total_km = models.FloatField(default=0)
+    total_time_seconds = models.FloatField(default=0)
+    ascent = models.FloatField(default=0)
+    descent = models.FloatField(default=0)
+    track_count = models.PositiveIntegerField(default=0)
+    max_speed = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["date"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["trip", "date"], name="dailystatistic_trip_date_uniq"
+            )
+        ]
+
+
+class TrackFile(models.Model):
+    """Fingerprint of a parsed track file, unchanged files are not parsed again."""
+
+    trip = models.ForeignKey(Trip, related_name="track_files", on_delete=models.CASCADE)
+    name = models.CharField(max_length=254)  # file stem, same as Track.title
+    size = models.BigIntegerField()
+    mtime = models.FloatField()
+    sha256 = models.CharField(max_length=64)
+    parser_version = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["trip", "name"], name="trackfile_trip_name_uniq"
+            )
+        ]
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Statistic, Track, Trip
+
+
+@receiver(post_save, sender=Track)
+@receiver(post_delete, sender=Track)
+def track_changed(sender, instance, **kwargs):
+    Trip.objects.filter(pk=instance.trip_id).bump_cache_version()
+
+
+@receiver(post_save, sender=Statistic)
+@receiver(post_delete, sender=Statistic)
+def statistic_changed(sender, instance, **kwargs):
+    # statistic is a part of the track's cached feature
+    # track could be already deleted together with the statistic
+    Track.objects.filter(pk=instance.track_id).update(updated=timezone.now())
+    Trip.objects.filter(tracks=instance.track_id).bump_cache_version()
@@ -7,6 +7,27 @@ from django.db.models.signals import post_delete, post_save
 from ..factories import UserFactory
 
 
+@pytest.fixture(autouse=True)
+def mute_signals(request):
+    # enable signals with @pytest.mark.enable_signals
+    if "enable_signals" in request.keywords:
+        yield
+        return
+
+    signals = [post_save, post_delete]
+    restore = {signal: signal.receivers for signal in signals}
+
+    for signal in signals:
+        signal.receivers = []
+        signal.sender_receivers_cache.clear()
+
+    yield
+
+    for signal, receivers in restore.items():
+        signal.receivers = receivers
+        signal.sender_receivers_cache.clear()
+
+
 @pytest.fixture()
 def project_fs(fs):
     fs.create_dir(path.join(settings.MEDIA_ROOT, "tracks", "1"))
@@ -0,0 +1,55 @@
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from ..utils.common import generate_cache_timeout, get_change_stamp, write_atomic
+
+
+def test_cache_timeout_ongoing_trip(settings):
+    today = date.today()
+    trip = SimpleNamespace(
+        start_date=today - timedelta(days=1), end_date=today + timedelta(days=1)
+    )
+
+    actual = generate_cache_timeout(trip)
+
+    assert actual == settings.GEOJSON_CACHE_TIMEOUTS["ongoing_trip"]
+
+
+def test_cache_timeout_past_trip_expires(settings):
+    trip = SimpleNamespace(start_date=date(2022, 1, 1), end_date=date(2022, 1, 31))
+
+    actual = generate_cache_timeout(trip)
+
+    # keys of superseded versions must not stay in the cache forever
+    assert actual == settings.GEOJSON_CACHE_TIMEOUTS["past_trip"]
+    assert actual is not None
+
+
+def test_get_change_stamp():
+    updated = datetime(2022, 1, 1, 0, 0, 0, 123456, tzinfo=timezone.utc)
+
+    assert get_change_stamp(updated) == 1640995200123456
+
+
+def test_write_atomic(tmp_path):
+    file = tmp_path / "1.bin"
+
+    with write_atomic(file) as f:
+        f.write(b"data")
+
+    assert file.read_bytes() == b"data"
+    assert list(tmp_path.iterdir()) == [file]
+
+
+def test_write_atomic_keeps_previous_on_error(tmp_path):
+    file = tmp_path / "1.bin"
+    file.write_bytes(b"previous")
+
+    with pytest.raises(ValueError), write_atomic(file) as f:
+        f.write(b"half")
+        raise ValueError("boom")
+
+    assert file.read_bytes() == b"previous"
+    assert list(tmp_path.iterdir()) == [file]
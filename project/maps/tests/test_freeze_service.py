@@ -0,0 +1,103 @@
+import gzip
+from datetime import date
+from types import SimpleNamespace
+
+import orjson
+import pytest
+
+from ..factories import TrackFactory, TripFactory
+from ..utils import freeze_service
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture()
+def media(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    return tmp_path
+
+
+def test_file_name():
+    trip = SimpleNamespace(pk=7, cache_version=3)
+
+    assert freeze_service.get_file_name(trip) == "geojson/7/3.geojson"
+
+
+def test_file_name_simplified_level():
+    trip = SimpleNamespace(pk=7, cache_version=3)
+
+    assert freeze_service.get_file_name(trip, "low") == "geojson/7/3_low.geojson"
+
+
+@pytest.mark.parametrize(
+    "frozen_version, expect",
+    [(None, False), (2, False), (3, True)],
+)
+def test_is_frozen(frozen_version, expect):
+    trip = SimpleNamespace(cache_version=3, frozen_version=frozen_version)
+
+    assert freeze_service.is_frozen(trip) is expect
+
+
+def test_freeze_trip_writes_files(media):
+    trip = TripFactory()
+    TrackFactory(trip=trip)
+
+    assert freeze_service.freeze_trip(trip)
+
+    path = media / "geojson" / str(trip.pk) / "0.geojson"
+    assert len(orjson.loads(path.read_bytes())["features"]) == 1
+    assert gzip.decompress(path.with_name("0.geojson.gz").read_bytes())
+    assert (path.parent / "0_low.geojson").exists()
+
+
+def test_freeze_trip_marks_trip(media):
+    trip = TripFactory()
+
+    freeze_service.freeze_trip(trip)
+    trip.refresh_from_db()
+
+    assert trip.frozen_version == 0
+
+
+def test_freeze_trip_removes_superseded_files(media):
+    trip = TripFactory()
+    folder = media / "geojson" / str(trip.pk)
+    folder.mkdir(parents=True)
+    (folder / "old.geojson").write_bytes(b"{}")
+
+    freeze_service.freeze_trip(trip)
+
+    assert not (folder / "old.geojson").exists()
+
+
+def test_freeze_trip_not_finished(media):
+    trip = TripFactory(end_date=date(2999, 1, 1))
+
+    with pytest.raises(freeze_service.FreezeServiceError):
+        freeze_service.freeze_trip(trip)
+
+
+def test_freeze_trip_version_bumped_meanwhile(media):
+    trip = TripFactory()
+    trip.bump_cache_version()
+    trip.cache_version = 0
+
+    assert not freeze_service.freeze_trip(trip)
+
+
+def test_context_frozen(settings):
+    settings.MEDIA_URL = "/media/"
+    trip = SimpleNamespace(pk=7, cache_version=3, frozen_version=3)
+
+    actual = freeze_service.create_context(trip)
+
+    assert actual["geojson_urls"]["low"] == "/media/geojson/7/3_low.geojson"
+    assert actual["geojson_urls"]["high"] == "/media/geojson/7/3.geojson"
+    assert actual["bbox_url"] is None
+
+
+def test_context_not_frozen():
+    trip = SimpleNamespace(pk=7, cache_version=4, frozen_version=3)
+
+    assert freeze_service.create_context(trip) == {}
@@ -0,0 +1,45 @@
+import pytest
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+
+from ..factories import StatisticFactory, TrackFactory, TripFactory
+from ..models import Statistic, Track
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(name="loader")
+def fixture_loader(settings):
+    # tests run without migrations, this one reads them from the disk
+    settings.MIGRATION_MODULES = {}
+
+    return MigrationLoader(connection)
+
+
+def test_track_trip_title_uniq_removes_duplicates(loader):
+    migration = loader.get_migration("maps", "0014_track_trip_title_uniq")
+    state = loader.project_state(("maps", "0013_trackfile"))
+
+    # the test database is created with the constraint, duplicates need it gone
+    constraint = next(
+        c for c in Track._meta.constraints if c.name == "track_trip_title_uniq"
+    )
+    with connection.schema_editor() as editor:
+        editor.remove_constraint(Track, constraint)
+
+    trip = TripFactory()
+    StatisticFactory(track=TrackFactory(trip=trip, title="1"))
+    new = StatisticFactory(track=TrackFactory(trip=trip, title="1"))
+    other = TrackFactory(trip=trip, title="2")
+
+    with connection.schema_editor() as editor:
+        migration.apply(state, editor)
+
+    # deferred foreign keys are checked now, not at the commit
+    connection.check_constraints()
+
+    assert list(Track.objects.order_by("pk").values_list("pk", flat=True)) == [
+        new.track.pk,
+        other.pk,
+    ]
+    assert list(Statistic.objects.values_list("pk", flat=True)) == [new.pk]
@@ -55,3 +55,9 @@ def test_activity_statistic(content_mck, garmin_activity):
     assert actual["descent"] == 222.0
     assert actual["min_altitude"] == 5
     assert actual["max_altitude"] == 55
+
+
+def test_activity_statistic_without_summary_file(tmp_path):
+    actual = get_statistic(tmp_path / "missing")
+
+    assert actual == {}
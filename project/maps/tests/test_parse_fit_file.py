@@ -0,0 +1,117 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import fitdecode
+import pytest
+from mock import patch
+
+from ..utils import parse_fit_file
+
+
+def semicircles(degrees):
+    return round(degrees * 2**31 / 180.0)
+
+
+class Frame:
+    frame_type = fitdecode.FIT_FRAME_DATA
+
+    def __init__(self, name, **values):
+        self.name = name
+        self.values = values
+
+    @property
+    def fields(self):
+        return [
+            SimpleNamespace(name=name, value=value)
+            for name, value in self.values.items()
+        ]
+
+    def get_value(self, field, fallback=None):
+        return self.values.get(field, fallback)
+
+
+@pytest.fixture(name="fit_reader")
+def fixture_fit_reader():
+    with patch("project.maps.utils.parse_fit_file.fitdecode.FitReader") as reader:
+        yield reader
+
+
+def set_frames(reader, frames):
+    reader.return_value.__enter__.return_value = frames
+
+
+def test_parse_track_points(fit_reader):
+    set_frames(
+        fit_reader,
+        [
+            Frame("file_id", time_created=datetime(2022, 1, 1, tzinfo=timezone.utc)),
+            Frame(
+                "record",
+                position_lat=semicircles(54),
+                position_long=semicircles(25),
+                enhanced_altitude=100.0,
+                heart_rate=120,
+                speed=5.5,
+                timestamp=datetime(2022, 1, 1, 1, tzinfo=timezone.utc),
+            ),
+            Frame("record", heart_rate=130),
+            Frame(
+                "record",
+                position_lat=semicircles(55),
+                position_long=semicircles(26),
+                altitude=110.0,
+                cadence=80,
+                enhanced_speed=6.0,
+                temperature=21,
+            ),
+        ],
+    )
+
+    track, actual = parse_fit_file.parse_track_points("file.fit")
+
+    assert track.path.coords == ((25, 54), (26, 55))
+    assert track.date == datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+    assert actual.pop("lat").tolist() == pytest.approx([54, 55])
+    assert actual.pop("lon").tolist() == pytest.approx([25, 26])
+    assert actual == {
+        "timestamp": [datetime(2022, 1, 1, 1, tzinfo=timezone.utc), None],
+        "altitude": [100.0, 110.0],
+        "heart_rate": [120, None],
+        "cadence": [None, 80],
+        "speed": [5.5, 6.0],
+        "temperature": [None, 21],
+    }
+
+
+def test_parse_track_points_without_path(fit_reader):
+    set_frames(
+        fit_reader,
+        [Frame("record", position_lat=semicircles(54), position_long=semicircles(25))],
+    )
+
+    track, points = parse_fit_file.parse_track_points("file.fit")
+
+    assert track.path is None
+    assert track.date.tzinfo is not None
+    assert points["lat"].tolist() == pytest.approx([54])
+
+
+def test_read_records_date_from_first_record(fit_reader):
+    set_frames(
+        fit_reader,
+        [
+            Frame("event"),
+            Frame(
+                "record",
+                position_lat=semicircles(54),
+                position_long=semicircles(25),
+                timestamp=datetime(2022, 1, 1, 1, tzinfo=timezone.utc),
+            ),
+        ],
+    )
+
+    actual = parse_fit_file.read_records("file.fit")
+
+    assert actual.date == datetime(2022, 1, 1, 1, tzinfo=timezone.utc)
+    assert actual.lat.tolist() == [semicircles(54)]
@@ -2,7 +2,11 @@ from datetime import datetime, timezone
 
 import pytest
 
-from ..utils.parse_tcx_file import get_track_date, get_track_path
+from ..utils.parse_tcx_file import (
+    get_track_date,
+    get_track_path,
+    parse_track_points,
+)
 
 
 @pytest.fixture(name="tcx_file")
@@ -75,3 +79,21 @@ def test_parsetcx_track_date(tcx_file):
     actual = get_track_date(tcx_file)
 
     assert actual == datetime(2025, 5, 26, 4, 28, 38, tzinfo=timezone.utc)
+
+
+def test_parse_track_points(tcx_file):
+    track, actual = parse_track_points(tcx_file)
+
+    assert track.path.coords == ((25.12346, 54.12346), (35.12346, 64.12346))
+    assert track.date == datetime(2025, 5, 26, 4, 28, 38, tzinfo=timezone.utc)
+    assert track.activity_type == "cycling"
+
+    assert actual["timestamp"] == [
+        datetime(2025, 5, 26, 4, 28, 38, tzinfo=timezone.utc),
+        datetime(2025, 5, 26, 4, 28, 38, tzinfo=timezone.utc),
+    ]
+    assert actual["lat"] == [54.12345678999999, 64.12345678999999]
+    assert actual["altitude"] == [162.1999969482422, 162.1999969482422]
+    assert actual["speed"] == [0.0, 0.0]
+    assert actual["heart_rate"] == [None, None]
+    assert actual["temperature"] == [None, None]
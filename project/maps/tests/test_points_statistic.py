@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from ..utils import points_statistic, track_points
+
+
+def create_points(tmp_path, size=3601, **columns):
+    start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    points = {
+        "timestamp": [start + timedelta(seconds=i) for i in range(size)],
+        # 1 degree of latitude in an hour, 111.195 km/h
+        "lat": np.linspace(54, 55, size).tolist(),
+        "lon": [25.0] * size,
+        "altitude": [100.0] * size,
+        "heart_rate": [None] * size,
+        "cadence": [None] * size,
+        "speed": [None] * size,
+        "temperature": [None] * size,
+    } | columns
+
+    file = tmp_path / "1.npy"
+    track_points.save(file, points)
+    return track_points.load(file)
+
+
+@pytest.mark.parametrize(
+    "altitude, expected",
+    [
+        ([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10], (10, 0)),
+        # noise below the threshold
+        ([0, 2, 0, 2, 0, 2, 0], (0, 0)),
+        # a small dip doesn't split the climb
+        ([0, 10, 8, 12, 0], (12, 12)),
+        ([100, 90, 95, 80, 100], (25, 25)),
+        ([100, 100, 100], (0, 0)),
+        ([100, np.nan, 110], (10, 0)),
+        ([100], (0, 0)),
+    ],
+)
+def test_get_ascent_descent(altitude, expected):
+    actual = points_statistic.get_ascent_descent(np.array(altitude, dtype=np.float64))
+
+    assert actual == expected
+
+
+def test_get_statistic(tmp_path):
+    size = 3601
+    points = create_points(
+        tmp_path,
+        heart_rate=[120, 140] * 1800 + [130],
+        cadence=[0, 80] * 1800 + [0],
+        temperature=[20.0] * size,
+    )
+
+    actual = points_statistic.get_statistic(points)
+
+    assert actual["total_km"] == pytest.approx(111.195, abs=0.01)
+    assert actual["total_time_seconds"] == 3600
+    assert actual["avg_speed"] == pytest.approx(111.195, abs=0.01)
+    assert actual["max_speed"] == pytest.approx(111.195, rel=0.01)
+    assert actual["avg_heart"] == pytest.approx(130)
+    assert actual["max_heart"] == 140
+    assert actual["avg_cadence"] == 80
+    assert actual["avg_temperature"] == 20
+    assert actual["min_altitude"] == 100
+    assert actual["ascent"] == 0
+    assert actual["calories"] is None
+
+
+def test_get_statistic_standing_is_not_moving(tmp_path):
+    size = 3601
+    points = create_points(tmp_path, lat=[54.0] * size)
+
+    actual = points_statistic.get_statistic(points)
+
+    assert actual["total_km"] == 0
+    assert actual["total_time_seconds"] == 0
+    assert actual["avg_speed"] is None
+
+
+def test_get_statistic_recorded_speed(tmp_path):
+    points = create_points(tmp_path, speed=[10.0] * 3600 + [20.0])
+
+    actual = points_statistic.get_statistic(points)
+
+    assert actual["max_speed"] == pytest.approx(72)
+
+
+def test_get_statistic_without_points():
+    assert points_statistic.get_statistic(None) == {}
+
+
+def test_fill_gaps():
+    summary = {"total_km": 10, "avg_heart": None, "avg_temperature": None}
+    computed = {"total_km": 11, "avg_heart": 120, "max_heart": 150}
+
+    actual = points_statistic.fill_gaps(summary, computed)
+
+    assert actual == {
+        "total_km": 10,
+        "avg_heart": 120,
+        "avg_temperature": None,
+        "max_heart": 150,
+    }
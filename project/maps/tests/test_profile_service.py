@@ -0,0 +1,152 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import orjson
+import pytest
+from mock import patch
+
+from ..factories import StatisticFactory, TrackFactory, TripFactory
+from ..utils import profile_service, track_points
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(name="media")
+def fixture_media(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    return tmp_path
+
+
+def save_points(track, lat, altitude, speed=None):
+    size = len(lat)
+    track_points.save(
+        track_points.get_file(track.trip_id, track.title),
+        {
+            "timestamp": [
+                datetime(2022, 1, 1, 0, 0, i, tzinfo=timezone.utc) for i in range(size)
+            ],
+            "lat": lat,
+            "lon": [25.0] * size,
+            "altitude": altitude,
+            "heart_rate": [None] * size,
+            "cadence": [None] * size,
+            "speed": speed or [None] * size,
+            "temperature": [None] * size,
+        },
+    )
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [(None, 500), ("x", 500), ("100", 100), ("1", 3), ("100000", 5000)],
+)
+def test_get_points(value, expected):
+    assert profile_service.get_points(value) == expected
+
+
+def test_lttb_keeps_first_and_last_points():
+    x = np.arange(100, dtype=np.float64)
+    y = np.sin(x)
+
+    actual = profile_service.lttb(x, y, 10)
+
+    assert len(actual) == 10
+    assert actual[0] == 0
+    assert actual[-1] == 99
+    assert np.all(np.diff(actual) > 0)
+
+
+def test_lttb_keeps_peaks():
+    x = np.arange(10, dtype=np.float64)
+    y = np.array([0, 0, 0, 5, 0, 0, 0, 0, -3, 0], dtype=np.float64)
+
+    actual = profile_service.lttb(x, y, 4)
+
+    assert actual.tolist() == [0, 3, 8, 9]
+
+
+def test_lttb_fewer_points_than_threshold():
+    x = np.arange(5, dtype=np.float64)
+
+    actual = profile_service.lttb(x, x, 10)
+
+    assert actual.tolist() == [0, 1, 2, 3, 4]
+
+
+def test_get_speed_from_timestamps(media):
+    track = TrackFactory()
+    save_points(track, [54.0, 54.001, 54.002], [1, 2, 3])
+    points = track_points.load_track(track)
+
+    actual = profile_service.get_speed(points, track_points.get_distance(points))
+
+    # 111 meters per second
+    assert np.isnan(actual[0])
+    assert actual[1:].tolist() == pytest.approx([400.3, 400.3], abs=0.1)
+
+
+def test_track_profile(media):
+    track = TrackFactory()
+    StatisticFactory(track=track)
+    save_points(track, [54.0, 54.001, 54.002], [100, None, 120], [1, 2, 3])
+
+    actual = orjson.loads(profile_service.create_track_profile(track, 500))
+
+    assert actual["track"] == track.pk
+    assert actual["statistic"]["ascent"] == 150
+    assert actual["elevation"] == [[0.0, 100.0], [0.222, 120.0]]
+    assert actual["speed"] == [[0.0, 3.6], [0.111, 7.2], [0.222, 10.8]]
+
+
+def test_track_profile_without_points(media):
+    track = TrackFactory()
+
+    actual = orjson.loads(profile_service.create_track_profile(track, 500))
+
+    assert actual["statistic"] is None
+    assert actual["elevation"] == []
+
+
+def test_trip_profile_joins_tracks(media):
+    trip = TripFactory()
+    first = TrackFactory(
+        trip=trip, title="1", date=datetime(2022, 1, 1, tzinfo=timezone.utc)
+    )
+    second = TrackFactory(
+        trip=trip, title="2", date=datetime(2022, 1, 2, tzinfo=timezone.utc)
+    )
+    TrackFactory(trip=trip, title="3")
+    save_points(second, [54.0, 54.001], [200, 210])
+    save_points(first, [54.0, 54.001], [100, 110])
+
+    actual = orjson.loads(profile_service.create_trip_profile(trip, 500))
+
+    assert actual["tracks"] == [first.pk, second.pk]
+    assert actual["starts"] == [0.0, 0.111]
+    assert actual["elevation"] == [
+        [0.0, 100.0],
+        [0.111, 110.0],
+        [0.111, 200.0],
+        [0.222, 210.0],
+    ]
+
+
+def test_track_cache_key_changes_with_track():
+    track = TrackFactory()
+    key = profile_service.generate_track_cache_key(track, 500)
+
+    track.save()
+
+    assert profile_service.generate_track_cache_key(track, 500) != key
+
+
+@patch("project.maps.utils.profile_service.create_track_profile", return_value=b"{}")
+def test_get_track_profile_cached(create_mock):
+    track = TrackFactory()
+
+    with patch.object(profile_service, "cache") as cache_mock:
+        cache_mock.get.return_value = b"cached"
+        actual = profile_service.get_track_profile(track, 500)
+
+    assert actual == b"cached"
+    create_mock.assert_not_called()
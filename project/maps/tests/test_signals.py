@@ -0,0 +1,65 @@
+import pytest
+
+from ..factories import StatisticFactory, TrackFactory, TripFactory
+from ..models import Track
+
+pytestmark = [pytest.mark.django_db, pytest.mark.enable_signals]
+
+
+def test_track_created_bumps_version():
+    trip = TripFactory()
+
+    TrackFactory(trip=trip)
+
+    trip.refresh_from_db()
+    assert trip.cache_version == 1
+    assert trip.tracks_updated
+
+
+def test_track_deleted_bumps_version():
+    trip = TripFactory()
+    track = TrackFactory(trip=trip)
+
+    track.delete()
+
+    trip.refresh_from_db()
+    assert trip.cache_version == 2
+
+
+def test_statistic_saved_bumps_version():
+    stats = StatisticFactory()
+    trip = stats.track.trip
+    trip.refresh_from_db()
+    version = trip.cache_version
+
+    stats.total_km = 99
+    stats.save()
+
+    trip.refresh_from_db()
+    assert trip.cache_version == version + 1
+
+
+def test_statistic_saved_touches_track():
+    stats = StatisticFactory()
+    updated = Track.objects.get(pk=stats.track.pk).updated
+
+    stats.save()
+
+    assert Track.objects.get(pk=stats.track.pk).updated > updated
+
+
+def test_other_trip_not_bumped():
+    trip = TripFactory(title="Other")
+
+    TrackFactory(trip=TripFactory())
+
+    trip.refresh_from_db()
+    assert trip.cache_version == 0
+
+
+def test_bump_cache_version():
+    trip = TripFactory()
+
+    trip.bump_cache_version()
+
+    assert trip.cache_version == 1
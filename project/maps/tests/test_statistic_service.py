@@ -0,0 +1,198 @@
+from datetime import date, datetime, timezone
+
+import orjson
+import pytest
+
+from ..factories import StatisticFactory, TrackFactory, TripFactory
+from ..models import DailyStatistic, TripStatistic
+from ..utils import statistic_service
+
+pytestmark = pytest.mark.django_db
+
+
+def test_aggregate_totals():
+    trip = TripFactory()
+    StatisticFactory(
+        track=TrackFactory(trip=trip, date=datetime(2022, 1, 2, tzinfo=timezone.utc)),
+        max_speed=30,
+    )
+    StatisticFactory(
+        track=TrackFactory(trip=trip, date=datetime(2022, 1, 5, tzinfo=timezone.utc))
+    )
+
+    actual = statistic_service.aggregate_totals(trip)
+
+    assert actual == {
+        "total_km": 20,
+        "total_time_seconds": 7200,
+        "ascent": 300,
+        "descent": 320,
+        "track_count": 2,
+        "max_speed": 30,
+        "first_date": datetime(2022, 1, 2, tzinfo=timezone.utc),
+        "last_date": datetime(2022, 1, 5, tzinfo=timezone.utc),
+    }
+
+
+def test_aggregate_totals_no_tracks():
+    actual = statistic_service.aggregate_totals(TripFactory())
+
+    assert actual["total_km"] == 0
+    assert actual["track_count"] == 0
+    assert actual["max_speed"] is None
+
+
+def test_rebuild_trip_statistic():
+    trip = TripFactory()
+    StatisticFactory(track=TrackFactory(trip=trip))
+    TripStatistic.objects.create(trip=trip, total_km=999)
+
+    statistic_service.rebuild_trip_statistic(trip)
+
+    actual = TripStatistic.objects.get(trip=trip)
+    assert actual.total_km == 10
+    assert actual.track_count == 1
+
+
+def test_add_trip_statistic():
+    trip = TripFactory()
+    StatisticFactory(
+        track=TrackFactory(trip=trip, date=datetime(2022, 1, 2, tzinfo=timezone.utc))
+    )
+    statistic_service.rebuild_trip_statistic(trip)
+    new = StatisticFactory(
+        track=TrackFactory(trip=trip, date=datetime(2022, 1, 3, tzinfo=timezone.utc)),
+        max_speed=40,
+    )
+
+    statistic_service.add_trip_statistic(trip, [new])
+
+    actual = TripStatistic.objects.get(trip=trip)
+    assert actual.total_km == 20
+    assert actual.ascent == 300
+    assert actual.track_count == 2
+    assert actual.max_speed == 40
+    assert actual.first_date == datetime(2022, 1, 2, tzinfo=timezone.utc)
+    assert actual.last_date == datetime(2022, 1, 3, tzinfo=timezone.utc)
+
+
+def test_add_trip_statistic_keeps_max_speed():
+    trip = TripFactory()
+    StatisticFactory(track=TrackFactory(trip=trip))
+    statistic_service.rebuild_trip_statistic(trip)
+    new = StatisticFactory(track=TrackFactory(trip=trip), max_speed=None)
+
+    statistic_service.add_trip_statistic(trip, [new])
+
+    assert TripStatistic.objects.get(trip=trip).max_speed == 25.4
+
+
+def test_add_trip_statistic_without_totals_rebuilds():
+    trip = TripFactory()
+    new = StatisticFactory(track=TrackFactory(trip=trip))
+
+    statistic_service.add_trip_statistic(trip, [new])
+
+    assert TripStatistic.objects.get(trip=trip).track_count == 1
+
+
+def test_totals_from_rollup():
+    trip = TripFactory()
+    TripStatistic.objects.create(trip=trip, total_km=5, ascent=7)
+
+    actual = statistic_service.get_totals(trip)
+
+    assert actual["total_km"] == 5
+    assert actual["total_ascent"] == 7
+
+
+def test_totals_without_rollup():
+    trip = TripFactory()
+    StatisticFactory(track=TrackFactory(trip=trip))
+
+    actual = statistic_service.get_totals(trip)
+
+    assert actual["total_km"] == 10
+    assert actual["total_time"] == 3600
+    assert actual["track_count"] == 1
+
+
+def test_local_date():
+    # 22:30 UTC is already the next day in Vilnius
+    actual = statistic_service.get_local_date(
+        datetime(2022, 1, 1, 22, 30, tzinfo=timezone.utc)
+    )
+
+    assert actual == date(2022, 1, 2)
+
+
+def test_aggregate_days_local_date():
+    trip = TripFactory()
+    StatisticFactory(
+        track=TrackFactory(trip=trip, date=datetime(2022, 1, 1, 8, tzinfo=timezone.utc))
+    )
+    StatisticFactory(
+        track=TrackFactory(
+            trip=trip, date=datetime(2022, 1, 1, 22, 30, tzinfo=timezone.utc)
+        )
+    )
+
+    actual = list(statistic_service.aggregate_days(trip))
+
+    assert [(row["day"], row["track_count"]) for row in actual] == [
+        (date(2022, 1, 1), 1),
+        (date(2022, 1, 2), 1),
+    ]
+
+
+def test_update_daily_statistic():
+    trip = TripFactory()
+    StatisticFactory(
+        track=TrackFactory(trip=trip, date=datetime(2022, 1, 1, 8, tzinfo=timezone.utc))
+    )
+    StatisticFactory(
+        track=TrackFactory(trip=trip, date=datetime(2022, 1, 1, 9, tzinfo=timezone.utc))
+    )
+
+    statistic_service.update_daily_statistic(trip)
+
+    actual = DailyStatistic.objects.get(trip=trip)
+    assert actual.date == date(2022, 1, 1)
+    assert actual.total_km == 20
+    assert actual.track_count == 2
+
+
+def test_update_daily_statistic_only_given_dates():
+    trip = TripFactory()
+    StatisticFactory(
+        track=TrackFactory(trip=trip, date=datetime(2022, 1, 1, 8, tzinfo=timezone.utc))
+    )
+    DailyStatistic.objects.create(trip=trip, date=date(2022, 1, 1), total_km=1)
+    DailyStatistic.objects.create(trip=trip, date=date(2022, 1, 5), total_km=5)
+
+    statistic_service.update_daily_statistic(trip, {date(2022, 1, 1)})
+
+    actual = DailyStatistic.objects.filter(trip=trip).values_list("date", "total_km")
+    assert list(actual) == [(date(2022, 1, 1), 10), (date(2022, 1, 5), 5)]
+
+
+def test_update_daily_statistic_removes_empty_days():
+    trip = TripFactory()
+    DailyStatistic.objects.create(trip=trip, date=date(2022, 1, 5), total_km=5)
+
+    statistic_service.update_daily_statistic(trip)
+
+    assert not DailyStatistic.objects.filter(trip=trip).exists()
+
+
+def test_daily_statistic_json():
+    trip = TripFactory()
+    DailyStatistic.objects.create(trip=trip, date=date(2022, 1, 2), total_km=2)
+    DailyStatistic.objects.create(trip=trip, date=date(2022, 1, 1), total_km=1)
+
+    actual = orjson.loads(statistic_service.get_daily_statistic(trip))
+
+    assert [(day["date"], day["total_km"]) for day in actual] == [
+        ("2022-01-01", 1),
+        ("2022-01-02", 2),
+    ]
@@ -0,0 +1,80 @@
+import gzip
+from pathlib import Path
+
+import pytest
+from mock import patch
+
+from ..utils import track_formats
+
+FIT_HEADER = b"\x0e\x20\x00\x00\x00\x00\x00\x00.FIT\x00\x00"
+TCX_HEADER = (
+    b'<?xml version="1.0" encoding="UTF-8"?>\n'
+    b'<TrainingCenterDatabase xmlns="http://www.garmin.com/xmlschemas/'
+    b'TrainingCenterDatabase/v2">'
+)
+
+
+@pytest.mark.parametrize(
+    "name, content, expected",
+    [
+        ("1.fit", FIT_HEADER, ("fit", False)),
+        ("1.tcx", TCX_HEADER, ("tcx", False)),
+        ("1.fit.gz", gzip.compress(FIT_HEADER), ("fit", True)),
+        ("1.tcx.gz", gzip.compress(TCX_HEADER), ("tcx", True)),
+        # content wins over the suffix
+        ("1.fit", TCX_HEADER, ("tcx", False)),
+        # unknown content falls back to the suffix
+        ("1.TCX", b"data", ("tcx", False)),
+    ],
+)
+def test_get_format(name, content, expected, tmp_path):
+    file = tmp_path / name
+    file.write_bytes(content)
+
+    assert track_formats.get_format(file) == expected
+
+
+def test_get_format_missing_file():
+    assert track_formats.get_format(Path("1.fit.gz")) == ("fit", True)
+
+
+def test_get_format_unknown(tmp_path):
+    file = tmp_path / "1.gpx"
+    file.write_bytes(b"data")
+
+    with pytest.raises(track_formats.TrackFormatError):
+        track_formats.get_format(file)
+
+
+def test_get_files_prefers_fit(tmp_path):
+    for name in ("1.fit", "1.tcx", "2.tcx.gz", "2.tcx", "3.fit.gz", "4.gpx", "5"):
+        (tmp_path / name).write_bytes(b"data")
+
+    actual = track_formats.get_files(tmp_path)
+
+    assert actual == {
+        "1": tmp_path / "1.fit",
+        "2": tmp_path / "2.tcx",
+        "3": tmp_path / "3.fit.gz",
+    }
+
+
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_parse_track_points_fit_gz(parse_mock, tmp_path):
+    file = tmp_path / "1.fit.gz"
+    file.write_bytes(gzip.compress(FIT_HEADER))
+
+    # fitdecode reads the decompressed stream, no copy is written
+    parse_mock.side_effect = lambda f: f.read()
+
+    assert track_formats.parse_track_points(file) == FIT_HEADER
+
+
+@patch("project.maps.utils.parse_tcx_file.parse_track_points")
+def test_parse_track_points_tcx(parse_mock, tmp_path):
+    file = tmp_path / "1.tcx"
+    file.write_bytes(TCX_HEADER)
+
+    track_formats.parse_track_points(file)
+
+    parse_mock.assert_called_once_with(str(file))
@@ -0,0 +1,172 @@
+import os
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from ..utils import track_points
+
+
+@pytest.fixture(name="points")
+def fixture_points():
+    return {
+        "timestamp": [datetime(2022, 1, 1, 1, tzinfo=timezone.utc), None],
+        "lat": [54.12345, 55.0],
+        "lon": [25.12345, 26.0],
+        "altitude": [100.5, None],
+        "heart_rate": [120, 130],
+        "cadence": [None, 80],
+        "speed": [5.5, 6.0],
+        "temperature": [21.0, 22.0],
+    }
+
+
+def test_get_file(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+
+    assert track_points.get_file(7, "1") == tmp_path / "points" / "7" / "1.npy"
+
+
+def test_save_and_load(points, tmp_path):
+    file = tmp_path / "7" / "1.npy"
+
+    track_points.save(file, points)
+    actual = track_points.load(file)
+
+    assert actual.timestamp.dtype == np.int32
+    assert actual.timestamp.tolist() == [
+        1640998800 - track_points.FIT_EPOCH,
+        track_points.MISSING_TIME,
+    ]
+    assert actual.lat.dtype == np.float32
+    assert actual.lat.tolist() == pytest.approx([54.12345, 55.0])
+    assert actual.altitude[0] == 100.5
+    assert np.isnan(actual.altitude[1])
+    assert actual.heart_rate.tolist() == [120, 130]
+    assert np.isnan(actual.cadence[0])
+
+
+def test_save_returns_columns(points, tmp_path):
+    actual = track_points.save(tmp_path / "1.npy", points)
+
+    assert actual.timestamp[1] == track_points.MISSING_TIME
+    assert actual.speed.tolist() == [5.5, 6.0]
+
+
+def test_timestamps_stored_as_int32(points, tmp_path):
+    file = tmp_path / "1.npy"
+    track_points.save(file, points)
+
+    actual = np.load(file)
+
+    assert actual.dtype["timestamp"].base == np.int32
+    assert actual.dtype["lat"].base == np.float32
+
+
+def test_load_is_memory_mapped(points, tmp_path):
+    file = tmp_path / "1.npy"
+    track_points.save(file, points)
+
+    actual = track_points.load(file)
+
+    assert all(isinstance(column, np.memmap) for column in actual)
+    assert all(column.flags["C_CONTIGUOUS"] for column in actual)
+
+
+def test_load_missing_file(tmp_path):
+    assert track_points.load(tmp_path / "1.npy") is None
+
+
+def test_load_broken_file(tmp_path):
+    file = tmp_path / "1.npy"
+    file.write_bytes(b"broken")
+
+    assert track_points.load(file) is None
+
+
+def test_load_older_layout(tmp_path):
+    file = tmp_path / "1.npy"
+    np.save(file, np.zeros((len(track_points.COLUMNS), 2), dtype=np.float32))
+
+    assert track_points.load(file) is None
+
+
+def test_load_track(points, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    track_points.save(track_points.get_file(7, "1"), points)
+
+    actual = track_points.load_track(SimpleNamespace(trip_id=7, title="1"))
+
+    assert len(actual.lat) == 2
+
+
+def test_remove(points, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    track_points.save(track_points.get_file(7, "1"), points)
+
+    track_points.remove(7, ["1", "2"])
+
+    assert not track_points.get_file(7, "1").exists()
+
+
+def test_haversine():
+    # one degree of latitude
+    actual = track_points.haversine(np.array([54.0, 55.0]), np.array([25.0, 25.0]))
+
+    assert actual.tolist() == pytest.approx([111.195], abs=0.001)
+
+
+def test_get_distance(points, tmp_path):
+    file = tmp_path / "1.npy"
+    track_points.save(file, points | {"lat": [54.0, 55.0], "lon": [25.0, 25.0]})
+
+    actual = track_points.get_distance(track_points.load(file))
+
+    assert actual.tolist() == pytest.approx([0, 111.195], abs=0.001)
+
+
+def test_publish_staged_points(points, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    track_points.save(track_points.get_file(7, "1"), points)
+
+    staging = track_points.create_staging(7)
+    track_points.save(staging / "1.npy", points | {"lat": [1.0, 2.0]})
+    track_points.save(staging / "2.npy", points)
+
+    # the previous file stays until the staged ones are published
+    assert track_points.load_track(SimpleNamespace(trip_id=7, title="1")).lat[0] != 1
+
+    track_points.publish(staging, 7)
+
+    assert track_points.load_track(SimpleNamespace(trip_id=7, title="1")).lat[0] == 1
+    assert track_points.get_file(7, "2").exists()
+    assert not staging.exists()
+
+
+def test_discard_staged_points(points, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+
+    staging = track_points.create_staging(7)
+    track_points.save(staging / "1.npy", points)
+
+    track_points.discard(staging)
+
+    assert not staging.exists()
+    assert not track_points.get_file(7, "1").exists()
+
+
+def test_create_staging_removes_stale(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    stale = track_points.create_staging(7)
+    running = track_points.create_staging(7)
+
+    old = time.time() - track_points.STALE_STAGING - 1
+    os.utime(stale, (old, old))
+
+    staging = track_points.create_staging(7)
+
+    assert not stale.exists()
+    assert running.exists()
+    assert staging.exists()
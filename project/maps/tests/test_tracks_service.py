@@ -1,17 +1,44 @@
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
+from pathlib import Path
 from types import SimpleNamespace
 
 import pytest
 from django.contrib.gis.geos import LineString
+from django.db import connection
 from mock import patch
 
 from ..factories import StatisticFactory, TrackFactory, TripFactory
-from ..models import Statistic, Track
-from ..utils.tracks_service import TracksService
+from ..models import DailyStatistic, Statistic, Track, TrackFile, TripStatistic
+from ..utils import parse_fit_file, track_points
+from ..utils.tracks_service import (
+    TracksService,
+    TracksServiceData,
+    hash_file,
+    parse_many,
+    parse_track_file,
+)
 
 pytestmark = pytest.mark.django_db
 
 
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    # points files of the parsed tracks are written there
+    settings.MEDIA_ROOT = tmp_path
+
+
+def parsed(
+    date=datetime(2022, 3, 4, 5, 6, 7, tzinfo=timezone.utc), activity_type="cycling"
+):
+    """
+    Returns the track and its points, as parse_track_points does.
+    """
+    track = parse_fit_file.ParsedTrack(LineString((5, 6), (7, 8)), date, activity_type)
+    points = dict.fromkeys(track_points.COLUMNS, [None, None])
+
+    return track, points | {"lat": [6.0, 8.0], "lon": [5.0, 7.0]}
+
+
 def test_init_trip():
     data = SimpleNamespace(
         trip=SimpleNamespace(title="T"), tracks_db=set(), tracks_disk=set()
@@ -88,11 +115,9 @@ def test_no_new_tracks():
 
 
 @patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
-@patch("project.maps.utils.parse_fit_file.get_track_path")
-@patch("project.maps.utils.parse_fit_file.get_track_date")
-def test_create_new_tracks(date_mock, path_mock, stats_mock):
-    path_mock.return_value = LineString((5, 6), (7, 8))
-    date_mock.return_value = datetime(2022, 3, 4, 5, 6, 7, tzinfo=timezone.utc)
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_create_new_tracks(parse_mock, stats_mock):
+    parse_mock.return_value = parsed()
 
     trip = TripFactory()
     data = SimpleNamespace(trip=trip, tracks_db=set(), tracks_disk={"1"})
@@ -108,11 +133,9 @@ def test_create_new_tracks(date_mock, path_mock, stats_mock):
 
 
 @patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
-@patch("project.maps.utils.parse_fit_file.get_track_path")
-@patch("project.maps.utils.parse_fit_file.get_track_date")
-def test_create_new_tracks_one_exists(date_mock, path_mock, stats_mock):
-    path_mock.return_value = LineString((5, 6), (7, 8))
-    date_mock.return_value = datetime(2022, 3, 4, 5, 6, 7, tzinfo=timezone.utc)
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_create_new_tracks_one_exists(parse_mock, stats_mock):
+    parse_mock.return_value = parsed()
 
     trip = TripFactory()
     data = SimpleNamespace(
@@ -130,11 +153,9 @@ def test_create_new_tracks_one_exists(date_mock, path_mock, stats_mock):
 
 
 @patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
-@patch("project.maps.utils.parse_fit_file.get_track_path")
-@patch("project.maps.utils.parse_fit_file.get_track_date")
-def test_not_create_new_tracks(date_mock, path_mock, stats_mock):
-    path_mock.return_value = LineString((5, 6), (7, 8))
-    date_mock.return_value = datetime(2022, 3, 4, 5, 6, 7, tzinfo=timezone.utc)
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_not_create_new_tracks(parse_mock, stats_mock):
+    parse_mock.return_value = parsed()
 
     trip = TripFactory()
     data = SimpleNamespace(
@@ -148,13 +169,11 @@ def test_not_create_new_tracks(date_mock, path_mock, stats_mock):
 
 
 @patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
-@patch("project.maps.utils.parse_fit_file.get_track_path")
-@patch("project.maps.utils.parse_fit_file.get_track_date")
-def test_update_track(date_mock, path_mock, stats_mock):
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_update_track(parse_mock, stats_mock):
     track = TrackFactory(title="1")
 
-    path_mock.return_value = LineString((5, 6), (7, 8))
-    date_mock.return_value = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    parse_mock.return_value = parsed(datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc))
 
     trip = TripFactory()
     data = SimpleNamespace(
@@ -172,11 +191,9 @@ def test_update_track(date_mock, path_mock, stats_mock):
 
 
 @patch("project.maps.utils.parse_activity_file.get_statistic")
-@patch("project.maps.utils.parse_fit_file.get_track_path")
-@patch("project.maps.utils.parse_fit_file.get_track_date")
-def test_create_new_statistic(date_mock, path_mock, stats_mock):
-    path_mock.return_value = LineString((5, 6), (7, 8))
-    date_mock.return_value = datetime(2022, 3, 4, 5, 6, 7, tzinfo=timezone.utc)
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_create_new_statistic(parse_mock, stats_mock):
+    parse_mock.return_value = parsed()
     stats_mock.return_value = {
         "total_km": 10.0,
         "total_time_seconds": 3600,
@@ -206,12 +223,10 @@ def test_create_new_statistic(date_mock, path_mock, stats_mock):
 
 
 @patch("project.maps.utils.parse_activity_file.get_statistic")
-@patch("project.maps.utils.parse_fit_file.get_track_path")
-@patch("project.maps.utils.parse_fit_file.get_track_date")
-def test_update_statistic(date_mock, path_mock, stats_mock):
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_update_statistic(parse_mock, stats_mock):
     # mock return values
-    date_mock.return_value = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
-    path_mock.return_value = LineString((5, 6), (7, 8))
+    parse_mock.return_value = parsed(datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc))
     stats_mock.return_value = {
         "total_km": 20.0,
         "total_time_seconds": 7200,
@@ -246,3 +261,480 @@ def test_update_statistic(date_mock, path_mock, stats_mock):
     assert actual.descent == 100
     assert actual.min_altitude == 300
     assert actual.max_altitude == 400
+
+
+@patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_create_bumps_cache_version(parse_mock, stats_mock):
+    parse_mock.return_value = parsed()
+
+    trip = TripFactory()
+    data = SimpleNamespace(trip=trip, tracks_db=set(), tracks_disk={"1"})
+
+    TracksService(data).create()
+
+    trip.refresh_from_db()
+    assert trip.cache_version == 1
+
+
+def test_nothing_to_create_keeps_cache_version():
+    trip = TripFactory()
+    data = SimpleNamespace(trip=trip, tracks_db=set(), tracks_disk=set())
+
+    TracksService(data).create()
+
+    trip.refresh_from_db()
+    assert trip.cache_version == 0
+
+
+@patch("project.maps.utils.parse_activity_file.get_statistic")
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_create_adds_trip_statistic(parse_mock, stats_mock):
+    parse_mock.return_value = parsed()
+    stats_mock.return_value = {"total_km": 10.0, "total_time_seconds": 3600}
+
+    trip = TripFactory()
+    StatisticFactory(track=TrackFactory(trip=trip))
+    TripStatistic.objects.create(trip=trip, total_km=10, track_count=1)
+    data = SimpleNamespace(trip=trip, tracks_db=[], tracks_disk={"2"})
+
+    TracksService(data).create()
+
+    actual = TripStatistic.objects.get(trip=trip)
+    assert actual.total_km == 20
+    assert actual.track_count == 2
+
+
+@patch("project.maps.utils.parse_activity_file.get_statistic")
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_update_rebuilds_trip_statistic(parse_mock, stats_mock):
+    parse_mock.return_value = parsed()
+    stats_mock.return_value = {"total_km": 20.0, "total_time_seconds": 3600}
+
+    stats = StatisticFactory()
+    trip = stats.track.trip
+    TripStatistic.objects.create(trip=trip, total_km=10, track_count=1)
+    data = SimpleNamespace(
+        trip=trip,
+        tracks_db=[{"title": stats.track.title, "pk": stats.track.pk}],
+        tracks_disk={stats.track.title},
+    )
+
+    TracksService(data).create_or_update()
+
+    actual = TripStatistic.objects.get(trip=trip)
+    assert actual.total_km == 20
+    assert actual.track_count == 1
+
+
+@patch("project.maps.utils.parse_activity_file.get_statistic")
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_create_updates_daily_statistic(parse_mock, stats_mock):
+    parse_mock.return_value = parsed()
+    stats_mock.return_value = {"total_km": 10.0, "total_time_seconds": 3600}
+
+    trip = TripFactory()
+    data = SimpleNamespace(trip=trip, tracks_db=[], tracks_disk={"2"})
+
+    TracksService(data).create()
+
+    actual = DailyStatistic.objects.get(trip=trip)
+    assert actual.date == date(2022, 3, 4)
+    assert actual.total_km == 10
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+@patch(
+    "project.maps.utils.tracks_service.parse_track_file",
+    side_effect=lambda track_file, points_file: track_file.stem,
+)
+def test_parse_many_keeps_order(parse_mock, workers, settings, tmp_path):
+    settings.TRACKS_BULK_SIZE = 3
+    files = [Path(f"{i}.fit") for i in range(10)]
+    points_files = [tmp_path / f"{i}.npy" for i in range(10)]
+
+    actual = list(parse_many(files, points_files, workers, executor="thread"))
+
+    assert actual == [str(i) for i in range(10)]
+
+
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_parse_many_returns_errors(parse_mock, tmp_path):
+    parse_mock.side_effect = [parsed(), parsed(), ValueError("broken")]
+    files = [Path(f"{i}.fit") for i in range(3)]
+    points_files = [tmp_path / f"{i}.npy" for i in range(3)]
+
+    # parsed one by one, so the broken file is the last one
+    actual = list(parse_many(files, points_files, workers=1))
+
+    assert [(r.file, r.error) for r in actual] == [
+        ("0.fit", None),
+        ("1.fit", None),
+        ("2.fit", "broken"),
+    ]
+
+
+@patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_create_tracks_in_chunks(parse_mock, stats_mock, settings):
+    settings.TRACKS_BULK_SIZE = 2
+    parse_mock.return_value = parsed()
+
+    trip = TripFactory()
+    data = SimpleNamespace(trip=trip, tracks_db=[], tracks_disk={"1", "2", "3"})
+
+    TracksService(data).create()
+
+    assert list(Track.objects.order_by("pk").values_list("title", flat=True)) == [
+        "1",
+        "2",
+        "3",
+    ]
+
+
+@patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_write_tracks_in_batches(parse_mock, stats_mock, settings):
+    settings.TRACKS_BULK_SIZE = 2
+    parse_mock.return_value = parsed(datetime(2022, 3, 4, tzinfo=timezone.utc))
+
+    trip = TripFactory()
+    data = SimpleNamespace(
+        trip=trip, tracks_db=[], tracks_disk={"1", "2", "3", "4", "5"}
+    )
+    obj = TracksService(data)
+
+    with patch.object(obj, "_save_tracks", wraps=obj._save_tracks) as save_mock:
+        obj.create()
+
+    assert [len(c.args[0]) for c in save_mock.call_args_list] == [2, 2, 1]
+    assert Track.objects.filter(trip=trip).count() == 5
+
+
+@patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_tracks_parsed_outside_transaction(parse_mock, stats_mock, settings):
+    settings.TRACKS_BULK_SIZE = 2
+    # transactions are per thread, files are parsed in this one
+    settings.TRACKS_PARSE_POOL = {"executor": "thread", "workers": 1}
+    depth = len(connection.atomic_blocks)
+    parse_depths = []
+
+    def parse(file):
+        parse_depths.append(len(connection.atomic_blocks))
+        return parsed()
+
+    parse_mock.side_effect = parse
+
+    trip = TripFactory()
+    data = SimpleNamespace(trip=trip, tracks_db=[], tracks_disk={"1", "2", "3"})
+    obj = TracksService(data)
+
+    with patch.object(obj, "_save_tracks", wraps=obj._save_tracks) as save_mock:
+        obj.create()
+
+    assert parse_depths == [depth] * 3
+    assert [len(c.args[0]) for c in save_mock.call_args_list] == [2, 1]
+    assert Track.objects.filter(trip=trip).count() == 3
+
+
+@patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_batches_staged_outside_media_root(parse_mock, stats_mock, settings):
+    parse_mock.return_value = parsed()
+
+    trip = TripFactory()
+    data = SimpleNamespace(trip=trip, tracks_db=[], tracks_disk={"1", "2"})
+    obj = TracksService(data)
+
+    with patch.object(obj, "_read_batches", wraps=obj._read_batches) as read_mock:
+        obj.create()
+
+    files = read_mock.call_args.args[0]
+    assert files
+    assert not any(file.is_relative_to(settings.MEDIA_ROOT) for file in files)
+    assert not any(file.exists() for file in files)
+
+
+@pytest.fixture(name="track_file")
+def fixture_track_file(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    trip = TripFactory()
+    folder = tmp_path / "tracks" / str(trip.pk)
+    folder.mkdir(parents=True)
+
+    file = folder / "1.fit"
+    file.write_bytes(b"fit data")
+
+    return trip, file
+
+
+def create_manifest(trip, file, **kwargs):
+    stat = file.stat()
+    fields = {
+        "trip": trip,
+        "name": file.stem,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": hash_file(file),
+        "parser_version": parse_fit_file.PARSER_VERSION,
+    }
+    return TrackFile.objects.create(**fields | kwargs)
+
+
+def test_changed_tracks_not_in_manifest(track_file):
+    trip, _ = track_file
+    data = SimpleNamespace(
+        trip=trip, tracks_db=[{"title": "1", "pk": 1}], tracks_disk={"1"}
+    )
+
+    assert TracksService(data).changed_tracks({"1"}) == {"1"}
+
+
+def test_changed_tracks_unchanged(track_file):
+    trip, file = track_file
+    create_manifest(trip, file)
+    data = SimpleNamespace(
+        trip=trip, tracks_db=[{"title": "1", "pk": 1}], tracks_disk={"1"}
+    )
+
+    assert TracksService(data).changed_tracks({"1"}) == set()
+
+
+def test_changed_tracks_not_in_db(track_file):
+    trip, file = track_file
+    create_manifest(trip, file)
+    data = SimpleNamespace(trip=trip, tracks_db=[], tracks_disk={"1"})
+
+    assert TracksService(data).changed_tracks({"1"}) == {"1"}
+
+
+def test_changed_tracks_touched(track_file):
+    trip, file = track_file
+    create_manifest(trip, file, mtime=1.0)
+    data = SimpleNamespace(
+        trip=trip, tracks_db=[{"title": "1", "pk": 1}], tracks_disk={"1"}
+    )
+
+    assert TracksService(data).changed_tracks({"1"}) == set()
+    assert TrackFile.objects.get(trip=trip).mtime == file.stat().st_mtime
+
+
+def test_changed_tracks_modified(track_file):
+    trip, file = track_file
+    create_manifest(trip, file, mtime=1.0, sha256="x" * 64)
+    data = SimpleNamespace(
+        trip=trip, tracks_db=[{"title": "1", "pk": 1}], tracks_disk={"1"}
+    )
+
+    assert TracksService(data).changed_tracks({"1"}) == {"1"}
+
+
+def test_changed_tracks_older_parser(track_file):
+    trip, file = track_file
+    create_manifest(trip, file, parser_version=0)
+    data = SimpleNamespace(
+        trip=trip, tracks_db=[{"title": "1", "pk": 1}], tracks_disk={"1"}
+    )
+
+    assert TracksService(data).changed_tracks({"1"}) == {"1"}
+
+
+@patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_create_or_update_skips_unchanged_files(parse_mock, stats_mock, track_file):
+    trip, _ = track_file
+    parse_mock.return_value = parsed(datetime(2022, 3, 4, tzinfo=timezone.utc))
+
+    TracksService(TracksServiceData(trip)).create_or_update()
+    _, qty = TracksService(TracksServiceData(trip)).create_or_update()
+
+    assert qty == 0
+    assert parse_mock.call_count == 1
+    assert TrackFile.objects.get(trip=trip).name == "1"
+
+
+def test_create_or_update_removes_vanished_tracks(track_file):
+    trip, file = track_file
+    track = TrackFactory(trip=trip, title="2")
+    create_manifest(trip, file)
+    TrackFactory(trip=trip, title="1")
+
+    data = TracksServiceData(trip)
+    TracksService(data).create_or_update()
+
+    assert not Track.objects.filter(pk=track.pk).exists()
+    assert list(Track.objects.values_list("title", flat=True)) == ["1"]
+
+
+@patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_create_or_update_force_keeps_track_pk(parse_mock, stats_mock, track_file):
+    trip, file = track_file
+    track = TrackFactory(trip=trip, title="1")
+    create_manifest(trip, file)
+    parse_mock.return_value = parsed(datetime(2022, 3, 4, tzinfo=timezone.utc))
+
+    _, qty = TracksService(TracksServiceData(trip)).create_or_update(force=True)
+
+    assert qty == 1
+    actual = Track.objects.get(trip=trip)
+    assert actual.pk == track.pk
+    assert actual.path.coords == ((5, 6), (7, 8))
+
+
+@patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+@patch.object(TracksService, "_save_manifest", side_effect=ValueError("boom"))
+def test_create_or_update_rolls_back(manifest_mock, parse_mock, stats_mock, track_file):
+    trip, _ = track_file
+    track = TrackFactory(trip=trip, title="2")
+    version = trip.cache_version
+    parse_mock.return_value = parsed(datetime(2022, 3, 4, tzinfo=timezone.utc))
+
+    msg, _ = TracksService(TracksServiceData(trip)).create_or_update()
+
+    assert msg == "Error occurred during saving tracks: boom"
+    assert list(Track.objects.values_list("pk", flat=True)) == [track.pk]
+    assert not TrackFile.objects.exists()
+
+    trip.refresh_from_db()
+    assert trip.cache_version == version
+
+
+@patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
+@patch("project.maps.utils.parse_tcx_file.parse_track_points")
+def test_create_tcx_track(parse_mock, stats_mock, track_file):
+    trip, file = track_file
+    file.rename(file.with_name("2.tcx.gz"))
+    parse_mock.return_value = parsed(
+        datetime(2022, 3, 4, tzinfo=timezone.utc), activity_type="running"
+    )
+
+    data = TracksServiceData(trip)
+    TracksService(data).create()
+
+    assert data.tracks_disk == {"2"}
+    actual = Track.objects.get(trip=trip)
+    assert actual.title == "2"
+    assert actual.activity_type == "running"
+    assert TrackFile.objects.get(trip=trip).name == "2"
+
+
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_parse_track_file_saves_points(parse_mock, tmp_path):
+    track, points = parsed()
+    parse_mock.return_value = track, points | {"altitude": [100.0, 110.0]}
+    points_file = tmp_path / "points" / "1.npy"
+
+    actual = parse_track_file(tmp_path / "1.fit", points_file)
+
+    assert actual == ("1.fit", track, None)
+    assert parse_mock.call_count == 1
+    assert track_points.load(points_file).altitude.tolist() == [100.0, 110.0]
+
+
+@patch(
+    "project.maps.utils.parse_fit_file.parse_track_points",
+    side_effect=ValueError("broken"),
+)
+def test_parse_track_file_error(parse_mock, tmp_path):
+    points_file = tmp_path / "1.npy"
+
+    actual = parse_track_file(tmp_path / "1.fit", points_file)
+
+    assert actual == ("1.fit", None, "broken")
+    assert not points_file.exists()
+
+
+@patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_create_skips_broken_files(parse_mock, stats_mock, settings):
+    settings.TRACKS_PARSE_POOL = {"executor": "thread", "workers": 1}
+    parse_mock.side_effect = [ValueError("broken"), parsed()]
+
+    trip = TripFactory()
+    data = SimpleNamespace(trip=trip, tracks_db=[], tracks_disk={"1", "2"})
+
+    msg, _ = TracksService(data).create()
+
+    assert msg.endswith("Can't parse 1.fit (broken)")
+    assert list(Track.objects.values_list("title", flat=True)) == ["2"]
+
+
+def test_create_statistic_from_points_without_summary(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    track = TrackFactory(title="1")
+    staging = tmp_path / "staged"
+    track_points.save(
+        staging / "1.npy",
+        {
+            "timestamp": [
+                datetime(2022, 1, 1, 0, 0, 0, tzinfo=timezone.utc),
+                datetime(2022, 1, 1, 0, 0, 10, tzinfo=timezone.utc),
+            ],
+            "lat": [54.0, 54.001],
+            "lon": [25.0, 25.0],
+            "altitude": [100.0, 100.0],
+            "heart_rate": [120, 140],
+            "cadence": [None, None],
+            "speed": [None, None],
+            "temperature": [20.0, 22.0],
+        },
+    )
+    data = SimpleNamespace(trip=track.trip, tracks_db=[], tracks_disk=set())
+
+    statistics, fields = TracksService(data)._create_statistic([track], staging)
+
+    assert statistics[0].total_km == pytest.approx(0.111, abs=0.001)
+    assert statistics[0].total_time_seconds == 10
+    assert statistics[0].avg_heart == 130
+    assert statistics[0].avg_temperature == 21
+    assert "avg_temperature" in fields
+
+
+@patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_points_published_on_commit(
+    parse_mock, stats_mock, django_capture_on_commit_callbacks
+):
+    parse_mock.return_value = parsed()
+
+    trip = TripFactory()
+    data = SimpleNamespace(trip=trip, tracks_db=[], tracks_disk={"1"})
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        TracksService(data).create()
+
+        # readers don't see points of the tracks not committed yet
+        assert not track_points.get_file(trip.pk, "1").exists()
+
+    for callback in callbacks:
+        callback()
+
+    assert track_points.get_file(trip.pk, "1").exists()
+    assert list(track_points.get_folder(trip.pk).iterdir()) == [
+        track_points.get_file(trip.pk, "1")
+    ]
+
+
+@patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_points_discarded_on_rollback(
+    parse_mock, stats_mock, django_capture_on_commit_callbacks
+):
+    parse_mock.return_value = parsed()
+
+    trip = TripFactory()
+    data = SimpleNamespace(trip=trip, tracks_db=[], tracks_disk={"1"})
+    obj = TracksService(data)
+
+    with (
+        patch.object(obj, "_save_tracks", side_effect=ValueError("boom")),
+        django_capture_on_commit_callbacks() as callbacks,
+    ):
+        msg, _ = obj.create()
+
+    assert msg == "Error occurred during saving tracks: boom"
+    assert not callbacks
+    assert not list(track_points.get_folder(trip.pk).iterdir())
@@ -1,11 +1,15 @@
-from datetime import date
+import gzip
+import json
+from datetime import date, datetime, timezone
 
 import pytest
+from django.contrib.gis.geos import LineString
 from django.urls import resolve, reverse
 from mock import patch
 
 from .. import models, views
-from ..factories import TripFactory
+from ..factories import TrackFactory, TripFactory
+from ..utils import parse_fit_file, track_points, views_map
 
 pytestmark = pytest.mark.django_db
 
@@ -39,6 +43,357 @@ def test_trips_list(client):
     assert "Trip 2" in content
 
 
+# -------------------------------------------------------------------------------------
+#                                                                    Tracks GeoJson View
+# -------------------------------------------------------------------------------------
+def test_tracks_geojson_func():
+    view = resolve("/trip-title/tracks.geojson")
+
+    assert views.TracksGeoJson == view.func.view_class
+
+
+def test_tracks_geojson_200(client):
+    trip = TripFactory()
+    TrackFactory(trip=trip)
+
+    url = reverse("maps:tracks_geojson", kwargs={"trip": trip.slug})
+    response = client.get(url, {"level": "low"})
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/geo+json"
+    assert len(response.json()["features"]) == 1
+
+
+@pytest.mark.enable_signals
+def test_tracks_geojson_etag(client):
+    trip = TripFactory()
+    TrackFactory(trip=trip)
+
+    url = reverse("maps:tracks_geojson", kwargs={"trip": trip.slug})
+    response = client.get(url)
+
+    assert response.has_header("ETag")
+    assert response.has_header("Last-Modified")
+    assert "no-cache" in response["Cache-Control"]
+
+
+def test_tracks_geojson_not_modified(client):
+    trip = TripFactory()
+    TrackFactory(trip=trip)
+
+    url = reverse("maps:tracks_geojson", kwargs={"trip": trip.slug})
+    etag = client.get(url)["ETag"]
+    response = client.get(url, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+    assert not response.content
+
+
+@pytest.mark.enable_signals
+def test_tracks_geojson_not_modified_since(client):
+    trip = TripFactory()
+    TrackFactory(trip=trip)
+
+    url = reverse("maps:tracks_geojson", kwargs={"trip": trip.slug})
+    last_modified = client.get(url)["Last-Modified"]
+    response = client.get(url, headers={"If-Modified-Since": last_modified})
+
+    assert response.status_code == 304
+
+
+@pytest.mark.enable_signals
+def test_tracks_geojson_modified(client):
+    trip = TripFactory()
+    TrackFactory(trip=trip)
+
+    url = reverse("maps:tracks_geojson", kwargs={"trip": trip.slug})
+    etag = client.get(url)["ETag"]
+
+    TrackFactory(trip=trip)
+    response = client.get(url, headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
+def test_tracks_geojson_gzip(client, monkeypatch):
+    monkeypatch.setattr("project.maps.utils.views_map.brotli", None)
+    trip = TripFactory()
+    TrackFactory(trip=trip)
+
+    url = reverse("maps:tracks_geojson", kwargs={"trip": trip.slug})
+    response = client.get(url, headers={"Accept-Encoding": "gzip, deflate"})
+
+    assert response["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response["Vary"]
+    assert len(json.loads(gzip.decompress(response.content))["features"]) == 1
+
+
+def test_tracks_geojson_identity(client):
+    trip = TripFactory()
+    TrackFactory(trip=trip)
+
+    url = reverse("maps:tracks_geojson", kwargs={"trip": trip.slug})
+    response = client.get(url)
+
+    assert not response.has_header("Content-Encoding")
+    assert "identity" in response["ETag"]
+
+
+@patch("project.maps.utils.views_map.set_cache")
+def test_tracks_geojson_stale_not_stored(set_cache_mock, client):
+    set_cache_mock.return_value = (views_map.encode(b'{"features":[]}'), False)
+    trip = TripFactory()
+
+    url = reverse("maps:tracks_geojson", kwargs={"trip": trip.slug})
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert "no-store" in response["Cache-Control"]
+    assert not response.has_header("ETag")
+
+
+@patch(
+    "project.maps.utils.views_map.set_cache",
+    side_effect=views_map.CacheRebuildingError("geojson"),
+)
+def test_tracks_geojson_rebuilding(set_cache_mock, client, settings):
+    settings.GEOJSON_REBUILD = settings.GEOJSON_REBUILD | {"retry_after": 5}
+    trip = TripFactory()
+
+    url = reverse("maps:tracks_geojson", kwargs={"trip": trip.slug})
+    response = client.get(url)
+
+    assert response.status_code == 503
+    assert response["Retry-After"] == "5"
+    assert "no-store" in response["Cache-Control"]
+
+
+def test_tracks_geojson_unknown_level(client):
+    trip = TripFactory()
+
+    url = reverse("maps:tracks_geojson", kwargs={"trip": trip.slug})
+    response = client.get(url, {"level": "xxx"})
+
+    assert response.status_code == 404
+
+
+def test_tracks_geojson_unknown_trip(client):
+    url = reverse("maps:tracks_geojson", kwargs={"trip": "xxx"})
+    response = client.get(url)
+
+    assert response.status_code == 404
+
+
+# -------------------------------------------------------------------------------------
+#                                                                      Bbox GeoJson View
+# -------------------------------------------------------------------------------------
+def test_bbox_geojson_func():
+    view = resolve("/bbox.geojson")
+
+    assert views.BboxGeoJson == view.func.view_class
+
+
+def test_trip_bbox_geojson_func():
+    view = resolve("/trip-title/bbox.geojson")
+
+    assert views.BboxGeoJson == view.func.view_class
+
+
+def test_bbox_geojson_200(client):
+    trip = TripFactory()
+    TrackFactory(trip=trip)
+
+    url = reverse("maps:trip_bbox", kwargs={"trip": trip.slug})
+    response = client.get(url, {"bbox": "0,0,10,10"})
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/geo+json"
+    assert len(json.loads(response.content)["features"]) == 1
+
+
+def test_bbox_geojson_invalid_bbox(client):
+    url = reverse("maps:bbox")
+    response = client.get(url, {"bbox": "10,10,0,0"})
+
+    assert response.status_code == 400
+
+
+def test_bbox_geojson_all_trips_too_large(client, settings):
+    settings.BBOX_LIMITS = {"max_area": 10, "max_tracks": 10}
+
+    url = reverse("maps:bbox")
+    response = client.get(url, {"bbox": "0,0,10,10"})
+
+    assert response.status_code == 400
+
+
+def test_bbox_geojson_all_trips_too_many_tracks(client, settings):
+    settings.BBOX_LIMITS = {"max_area": 400, "max_tracks": 1}
+    TrackFactory()
+    TrackFactory()
+
+    url = reverse("maps:bbox")
+    response = client.get(url, {"bbox": "0,0,10,10"})
+
+    assert response.status_code == 400
+
+
+def test_bbox_geojson_trip_without_limits(client, settings):
+    settings.BBOX_LIMITS = {"max_area": 10, "max_tracks": 1}
+    trip = TripFactory()
+    TrackFactory(trip=trip)
+    TrackFactory(trip=trip)
+
+    url = reverse("maps:trip_bbox", kwargs={"trip": trip.slug})
+    response = client.get(url, {"bbox": "0,0,10,10"})
+
+    assert response.status_code == 200
+    assert len(json.loads(response.content)["features"]) == 2
+
+
+def test_bbox_geojson_unknown_level(client):
+    url = reverse("maps:bbox")
+    response = client.get(url, {"bbox": "0,0,10,10", "level": "xxx"})
+
+    assert response.status_code == 404
+
+
+def test_bbox_geojson_unknown_trip(client):
+    url = reverse("maps:trip_bbox", kwargs={"trip": "xxx"})
+    response = client.get(url, {"bbox": "0,0,10,10"})
+
+    assert response.status_code == 404
+
+
+# -------------------------------------------------------------------------------------
+#                                                                   Daily Statistic View
+# -------------------------------------------------------------------------------------
+def test_daily_statistic_func():
+    view = resolve("/trip-title/daily.json")
+
+    assert views.DailyStatistic == view.func.view_class
+
+
+def test_daily_statistic_200(client):
+    trip = TripFactory()
+    models.DailyStatistic.objects.create(trip=trip, date=date(2022, 1, 1), total_km=1)
+
+    url = reverse("maps:daily_statistic", kwargs={"trip": trip.slug})
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/json"
+    assert json.loads(response.content)[0]["date"] == "2022-01-01"
+
+
+def test_daily_statistic_unknown_trip(client):
+    url = reverse("maps:daily_statistic", kwargs={"trip": "xxx"})
+    response = client.get(url)
+
+    assert response.status_code == 404
+
+
+# -------------------------------------------------------------------------------------
+#                                                                     Trip Profile View
+# -------------------------------------------------------------------------------------
+def test_trip_profile_func():
+    view = resolve("/trip-title/profile.json")
+
+    assert views.TripProfile == view.func.view_class
+
+
+def test_trip_profile_200(client):
+    trip = TripFactory()
+
+    url = reverse("maps:trip_profile", kwargs={"trip": trip.slug})
+    response = client.get(url, {"points": "100"})
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/json"
+    assert json.loads(response.content)["elevation"] == []
+
+
+def test_trip_profile_unknown_trip(client):
+    url = reverse("maps:trip_profile", kwargs={"trip": "xxx"})
+    response = client.get(url)
+
+    assert response.status_code == 404
+
+
+# -------------------------------------------------------------------------------------
+#                                                                    Track Profile View
+# -------------------------------------------------------------------------------------
+def test_track_profile_func():
+    view = resolve("/trip-title/tracks/1/profile.json")
+
+    assert views.TrackProfile == view.func.view_class
+
+
+def test_track_profile_200(client):
+    track = TrackFactory()
+
+    url = reverse(
+        "maps:track_profile", kwargs={"trip": track.trip.slug, "pk": track.pk}
+    )
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert json.loads(response.content)["track"] == track.pk
+
+
+def test_track_profile_of_other_trip(client):
+    track = TrackFactory()
+    other = TripFactory(title="Other")
+
+    url = reverse("maps:track_profile", kwargs={"trip": other.slug, "pk": track.pk})
+    response = client.get(url)
+
+    assert response.status_code == 404
+
+
+# -------------------------------------------------------------------------------------
+#                                                                      Tracks Tile View
+# -------------------------------------------------------------------------------------
+def test_tracks_tile_func():
+    view = resolve("/trip-title/tiles/1/2/3.mvt")
+
+    assert views.TracksTile == view.func.view_class
+
+
+def test_tracks_tile_200(client):
+    trip = TripFactory()
+    TrackFactory(trip=trip)
+
+    url = reverse("maps:tiles", kwargs={"trip": trip.slug, "z": 0, "x": 0, "y": 0})
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/vnd.mapbox-vector-tile"
+    assert "no-cache" in response["Cache-Control"]
+
+
+def test_tracks_tile_invalid(client):
+    trip = TripFactory()
+
+    url = reverse("maps:tiles", kwargs={"trip": trip.slug, "z": 1, "x": 2, "y": 0})
+    response = client.get(url)
+
+    assert response.status_code == 404
+
+
+def test_tracks_tile_finished_trip_immutable(client):
+    trip = TripFactory()
+    TrackFactory(trip=trip)
+
+    url = reverse("maps:tiles", kwargs={"trip": trip.slug, "z": 0, "x": 0, "y": 0})
+    version = client.get(url)["ETag"].strip('"').rsplit("-", 3)[0]
+    response = client.get(url, {"v": version})
+
+    assert "immutable" in response["Cache-Control"]
+
+
 # -------------------------------------------------------------------------------------
 #                                                                        Utilities View
 # -------------------------------------------------------------------------------------
@@ -345,6 +700,53 @@ def test_update_tracks_not_logged(client):
     assert response.status_code == 302
 
 
+# -------------------------------------------------------------------------------------
+#                                                            Update Changed Tracks View
+# -------------------------------------------------------------------------------------
+def test_update_changed_tracks_func():
+    view = resolve("/utils/update_changed_tracks/trip-title/")
+
+    assert views.UpdateChangedTracks == view.func.view_class
+
+
+def test_update_changed_tracks_not_logged(client):
+    trip = TripFactory()
+
+    url = reverse("maps:update_changed_tracks", kwargs={"trip": trip.slug})
+    response = client.get(url)
+
+    assert response.status_code == 302
+
+
+@patch("project.maps.utils.views_map.refresh_cache")
+@patch("project.maps.utils.parse_activity_file.get_statistic", return_value={})
+@patch("project.maps.utils.parse_fit_file.parse_track_points")
+def test_update_changed_tracks_skips_unchanged(
+    parse_mock, stats_mock, refresh_mock, client_logged, settings, tmp_path
+):
+    settings.MEDIA_ROOT = tmp_path
+    trip = TripFactory()
+    folder = tmp_path / "tracks" / str(trip.pk)
+    folder.mkdir(parents=True)
+    (folder / "1.fit").write_bytes(b"fit data")
+    parse_mock.return_value = (
+        parse_fit_file.ParsedTrack(
+            LineString((5, 6), (7, 8)),
+            datetime(2022, 3, 4, tzinfo=timezone.utc),
+        ),
+        {name: [] for name in track_points.COLUMNS},
+    )
+
+    url = reverse("maps:update_changed_tracks", kwargs={"trip": trip.slug})
+    client_logged.get(url)
+    response = client_logged.get(url)
+
+    assert response.status_code == 200
+    assert parse_mock.call_count == 1
+    assert refresh_mock.call_count == 1
+    assert models.Track.objects.filter(trip=trip).count() == 1
+
+
 # -------------------------------------------------------------------------------------
 #                                                               Rewrite All Tracks View
 # -------------------------------------------------------------------------------------
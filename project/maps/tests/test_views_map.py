@@ -0,0 +1,500 @@
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from django.contrib.gis.geos import LineString
+from mock import patch
+
+from ..factories import StatisticFactory, TrackFactory, TripFactory
+from ..utils import views_map
+
+pytestmark = pytest.mark.django_db
+
+
+def test_cache_key():
+    trip = SimpleNamespace(pk=7, cache_version=3)
+
+    assert views_map.generate_cache_key(trip) == "geojson_7_v3"
+
+
+def test_cache_key_full_level():
+    trip = SimpleNamespace(pk=7, cache_version=3)
+
+    assert views_map.generate_cache_key(trip, "high") == "geojson_7_v3"
+
+
+def test_cache_key_simplified_level():
+    trip = SimpleNamespace(pk=7, cache_version=3)
+
+    assert views_map.generate_cache_key(trip, "low") == "geojson_7_v3_low"
+
+
+def test_manifest_cache_key():
+    trip = SimpleNamespace(pk=7, cache_version=3)
+
+    assert views_map.generate_manifest_cache_key(trip) == "geojson_manifest_7_v3"
+
+
+def test_path_array():
+    path = LineString((1.123456, 2), (3, 4.000004), srid=4326)
+
+    actual = views_map.path_array(path)
+
+    assert actual.shape == (2, 2)
+    assert actual.tolist() == [[1.12346, 2], [3, 4]]
+
+
+def test_path_array_drops_z():
+    path = LineString((1, 2, 100), (3, 4, 200), srid=4326)
+
+    assert views_map.path_array(path).tolist() == [[1, 2], [3, 4]]
+
+
+def test_path_array_empty():
+    assert views_map.path_array(None).shape == (0, 2)
+
+
+def test_geo_dict():
+    track = SimpleNamespace(
+        date=datetime(2022, 1, 1, 3, 2, 1, tzinfo=timezone.utc),
+        path=LineString((1, 2), (3, 4), srid=4326),
+    )
+
+    actual = views_map.create_geo_dict([track])
+
+    feature = actual["features"][0]
+    assert feature["geometry"]["coordinates"].tolist() == [[1, 2], [3, 4]]
+    assert feature["properties"]["last_point"] == [4, 3]
+    assert feature["properties"]["date"] == "2022-01-01"
+
+
+def test_geo_dict_other_path_field():
+    track = SimpleNamespace(
+        date=datetime(2022, 1, 1, 3, 2, 1, tzinfo=timezone.utc),
+        path=None,
+        simplified_path=LineString((1, 2), (3, 4), srid=4326),
+    )
+
+    actual = views_map.create_geo_dict([track], "simplified_path")
+
+    coords = actual["features"][0]["geometry"]["coordinates"]
+    assert coords.tolist() == [[1, 2], [3, 4]]
+
+
+def test_geo_json_simplified_level():
+    trip = TripFactory()
+    StatisticFactory(
+        track=TrackFactory(
+            trip=trip,
+            path=LineString((0, 0), (0.5, 0.0001), (1, 0), srid=4326),
+        )
+    )
+
+    actual = orjson.loads(views_map.create_geo_json(trip, "low"))
+
+    feature = actual["features"][0]
+    assert feature["geometry"]["coordinates"] == [[0, 0], [1, 0]]
+    assert feature["properties"]["last_point"] == [0, 1]
+    assert feature["properties"]["total_km"] == 10
+
+
+def test_geo_json_full_level():
+    trip = TripFactory()
+    TrackFactory(
+        trip=trip,
+        path=LineString((0, 0), (0.5, 0.0001), (1, 0), srid=4326),
+    )
+
+    actual = orjson.loads(views_map.create_geo_json(trip, "high"))
+
+    assert len(actual["features"][0]["geometry"]["coordinates"]) == 3
+
+
+def test_geo_json_version():
+    updated = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    trip = SimpleNamespace(pk=7, cache_version=3, tracks_updated=updated)
+
+    etag, last_modified = views_map.get_geo_json_version(trip, "low")
+
+    assert etag == '"7-3-low-identity"'
+    assert last_modified == updated
+
+
+def test_geo_json_version_encoding():
+    trip = SimpleNamespace(pk=7, cache_version=3, tracks_updated=None)
+
+    etag, _ = views_map.get_geo_json_version(trip, None, "gzip")
+
+    assert etag == '"7-3--gzip"'
+
+
+def test_geo_json_version_not_bumped():
+    trip = TripFactory()
+
+    etag, last_modified = views_map.get_geo_json_version(trip)
+
+    assert etag == f'"{trip.pk}-0--identity"'
+    assert last_modified is None
+
+
+def test_feature_cache_key():
+    updated = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+    actual = views_map.generate_feature_cache_key(3, updated)
+
+    assert actual == "geojson_feature_3_1640995200000000"
+
+
+def test_feature_cache_key_simplified_level():
+    updated = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+    actual = views_map.generate_feature_cache_key(3, updated, "low")
+
+    assert actual == "geojson_feature_3_1640995200000000_low"
+
+
+def test_manifest():
+    trip = TripFactory()
+    track2 = TrackFactory(trip=trip, date=datetime(2022, 1, 2, tzinfo=timezone.utc))
+    track1 = TrackFactory(trip=trip, date=datetime(2022, 1, 1, tzinfo=timezone.utc))
+
+    actual = views_map.get_manifest(trip)
+
+    assert actual == [
+        (track1.pk, views_map.generate_feature_cache_key(track1.pk, track1.updated)),
+        (track2.pk, views_map.generate_feature_cache_key(track2.pk, track2.updated)),
+    ]
+
+
+def test_geo_json_no_tracks():
+    trip = TripFactory()
+
+    actual = orjson.loads(views_map.create_geo_json(trip))
+
+    assert actual == {"type": "FeatureCollection", "features": []}
+
+
+def test_geo_json_features_ordered_by_date():
+    trip = TripFactory()
+    TrackFactory(trip=trip, date=datetime(2022, 1, 2, tzinfo=timezone.utc))
+    TrackFactory(trip=trip, date=datetime(2022, 1, 1, tzinfo=timezone.utc))
+
+    actual = orjson.loads(views_map.create_geo_json(trip))
+
+    assert [f["properties"]["date"] for f in actual["features"]] == [
+        "2022-01-01",
+        "2022-01-02",
+    ]
+
+
+@patch("project.maps.utils.views_map.create_features")
+def test_geo_json_serializes_only_missing_features(features_mock):
+    trip = TripFactory()
+    cached = TrackFactory(trip=trip, date=datetime(2022, 1, 1, tzinfo=timezone.utc))
+    new = TrackFactory(trip=trip, date=datetime(2022, 1, 2, tzinfo=timezone.utc))
+    cached_key = views_map.generate_feature_cache_key(cached.pk, cached.updated)
+    features_mock.return_value = {new.pk: b'{"id":2}'}
+
+    with patch.object(
+        views_map.cache, "get_many", return_value={cached_key: b'{"id":1}'}
+    ):
+        actual = views_map.create_geo_json(trip)
+
+    features_mock.assert_called_once_with([new.pk], None)
+    assert orjson.loads(actual)["features"] == [{"id": 1}, {"id": 2}]
+
+
+@pytest.mark.parametrize("level", ["low", "high"])
+def test_features_in_db_same_as_python(level):
+    trip = TripFactory()
+    track1 = StatisticFactory(
+        track=TrackFactory(
+            trip=trip,
+            path=LineString((0, 0), (0.5, 0.0001), (1, 0), srid=4326),
+        )
+    ).track
+    track2 = TrackFactory(trip=trip)
+
+    expect = views_map.create_features([track1.pk, track2.pk], level)
+    actual = views_map.create_features_in_db([track1.pk, track2.pk], level)
+
+    assert actual.keys() == expect.keys()
+    for pk, feature in actual.items():
+        assert orjson.loads(feature) == orjson.loads(expect[pk])
+
+
+def test_geo_json_generated_in_db(settings):
+    settings.GEOJSON_GENERATION = "database"
+    trip = TripFactory()
+    TrackFactory(trip=trip)
+
+    actual = orjson.loads(views_map.create_geo_json(trip))
+
+    assert actual["features"][0]["properties"]["last_point"] == [4, 3]
+
+
+def test_parse_bbox():
+    actual = views_map.parse_bbox("1,2,3,4")
+
+    assert actual.extent == (1, 2, 3, 4)
+    assert actual.srid == 4326
+
+
+@pytest.mark.parametrize(
+    "value",
+    [None, "", "1,2,3", "a,b,c,d", "3,2,1,4", "1,4,3,2", "nan,2,3,4", "1,2,inf,4"],
+)
+def test_parse_bbox_invalid(value):
+    assert views_map.parse_bbox(value) is None
+
+
+def test_bbox_geo_json():
+    trip = TripFactory()
+    TrackFactory(trip=trip, path=LineString((1, 1), (2, 2), srid=4326))
+    TrackFactory(trip=trip, path=LineString((10, 10), (20, 20), srid=4326))
+
+    bbox = views_map.parse_bbox("0,0,3,3")
+    actual = orjson.loads(views_map.create_bbox_geo_json(bbox, trip))
+
+    assert [f["properties"]["last_point"] for f in actual["features"]] == [[2, 2]]
+
+
+def test_bbox_geo_json_filtered_by_trip():
+    trip = TripFactory()
+    TrackFactory(trip=trip, path=LineString((1, 1), (2, 2), srid=4326))
+    TrackFactory(path=LineString((1, 1), (2.5, 2.5), srid=4326))
+
+    bbox = views_map.parse_bbox("0,0,3,3")
+    actual = orjson.loads(views_map.create_bbox_geo_json(bbox, trip))
+
+    assert [f["properties"]["last_point"] for f in actual["features"]] == [[2, 2]]
+
+
+def test_bbox_geo_json_all_trips():
+    TrackFactory(path=LineString((1, 1), (2, 2), srid=4326))
+    TrackFactory(path=LineString((1, 1), (2, 2), srid=4326))
+
+    bbox = views_map.parse_bbox("0,0,3,3")
+    actual = orjson.loads(views_map.create_bbox_geo_json(bbox))
+
+    assert len(actual["features"]) == 2
+
+
+def test_bbox_geo_json_over_limit():
+    TrackFactory(path=LineString((1, 1), (2, 2), srid=4326))
+    TrackFactory(path=LineString((1, 1), (2, 2), srid=4326))
+
+    bbox = views_map.parse_bbox("0,0,3,3")
+
+    assert views_map.create_bbox_geo_json(bbox, limit=1) is None
+
+
+def test_bbox_geo_json_within_limit():
+    TrackFactory(path=LineString((1, 1), (2, 2), srid=4326))
+    TrackFactory(path=LineString((1, 1), (2, 2), srid=4326))
+
+    bbox = views_map.parse_bbox("0,0,3,3")
+    actual = orjson.loads(views_map.create_bbox_geo_json(bbox, limit=2))
+
+    assert len(actual["features"]) == 2
+
+
+def test_is_bbox_allowed(settings):
+    settings.BBOX_LIMITS = {"max_area": 4, "max_tracks": 10}
+
+    assert views_map.is_bbox_allowed(views_map.parse_bbox("0,0,2,2"))
+    assert not views_map.is_bbox_allowed(views_map.parse_bbox("0,0,3,3"))
+
+
+def test_stale_cache_key():
+    trip = SimpleNamespace(pk=7, cache_version=3)
+
+    assert views_map.generate_stale_cache_key(trip, "low") == "geojson_stale_7_low"
+
+
+def test_not_expiring_without_expiry():
+    assert not views_map.is_expiring({"delta": 100, "expiry": None})
+
+
+def test_expiring_after_expiry():
+    assert views_map.is_expiring({"delta": 0, "expiry": time.time() - 1})
+
+
+def test_not_expiring_far_from_expiry():
+    assert not views_map.is_expiring({"delta": 0, "expiry": time.time() + 3600})
+
+
+def test_set_cache_returns_cached():
+    trip = SimpleNamespace(pk=7, cache_version=3)
+    cached = {"data": {"gzip": b"x"}, "delta": 1, "expiry": None}
+
+    with patch.object(views_map, "cache") as cache_mock:
+        cache_mock.get.return_value = cached
+        actual = views_map.set_cache(trip)
+
+    assert actual == ({"gzip": b"x"}, True)
+    cache_mock.lock.assert_not_called()
+
+
+@patch("project.maps.utils.views_map.build_cache", return_value={"gzip": b"new"})
+def test_set_cache_rebuilt_by_lock_holder(build_mock):
+    trip = SimpleNamespace(pk=7, cache_version=3)
+
+    with patch.object(views_map, "cache") as cache_mock:
+        cache_mock.get.return_value = None
+        cache_mock.lock.return_value.acquire.return_value = True
+        actual = views_map.set_cache(trip)
+
+    assert actual == ({"gzip": b"new"}, True)
+    build_mock.assert_called_once()
+    cache_mock.lock.return_value.release.assert_called_once()
+
+
+@patch("project.maps.utils.views_map.build_cache")
+def test_set_cache_stale_while_locked(build_mock):
+    trip = SimpleNamespace(pk=7, cache_version=3)
+    stale = {"data": {"gzip": b"old"}, "delta": 1, "expiry": None}
+    values = {"geojson_stale_7": "geojson_7_v2", "geojson_7_v2": stale}
+
+    with patch.object(views_map, "cache") as cache_mock:
+        cache_mock.get.side_effect = values.get
+        cache_mock.lock.return_value.acquire.return_value = False
+        actual = views_map.set_cache(trip)
+
+    assert actual == ({"gzip": b"old"}, False)
+    build_mock.assert_not_called()
+
+
+@patch("project.maps.utils.views_map.build_cache", return_value={"gzip": b"new"})
+def test_set_cache_waits_then_takes_over_lock(build_mock, settings):
+    settings.GEOJSON_REBUILD = settings.GEOJSON_REBUILD | {"wait": 0}
+    trip = SimpleNamespace(pk=7, cache_version=3)
+
+    with patch.object(views_map, "cache") as cache_mock:
+        cache_mock.get.return_value = None
+        cache_mock.lock.return_value.acquire.side_effect = [False, True]
+        actual = views_map.set_cache(trip)
+
+    assert actual == ({"gzip": b"new"}, True)
+    build_mock.assert_called_once()
+    cache_mock.lock.return_value.release.assert_called_once()
+
+
+@patch("project.maps.utils.views_map.build_cache")
+def test_set_cache_waits_then_gives_up(build_mock, settings):
+    settings.GEOJSON_REBUILD = settings.GEOJSON_REBUILD | {"wait": 0}
+    trip = SimpleNamespace(pk=7, cache_version=3)
+
+    with patch.object(views_map, "cache") as cache_mock:
+        cache_mock.get.return_value = None
+        cache_mock.lock.return_value.acquire.return_value = False
+
+        with pytest.raises(views_map.CacheRebuildingError):
+            views_map.set_cache(trip)
+
+    build_mock.assert_not_called()
+
+
+@patch(
+    "project.maps.utils.views_map.set_cache",
+    side_effect=views_map.CacheRebuildingError("geojson_7_v3"),
+)
+def test_refresh_cache_skips_rebuilding(set_cache_mock):
+    trip = TripFactory()
+
+    views_map.refresh_cache(trip)
+
+    assert set_cache_mock.call_count == len(views_map.get_detail_levels())
+
+
+def test_build_cache_points_stale_key():
+    trip = TripFactory()
+
+    with patch.object(views_map, "cache") as cache_mock:
+        views_map.build_cache(trip, "geojson_key")
+
+    cache_mock.set.assert_called_with(
+        key=f"geojson_stale_{trip.pk}", value="geojson_key", timeout=None
+    )
+
+
+def test_is_cached():
+    trip = SimpleNamespace(pk=7, cache_version=3)
+
+    with patch.object(views_map, "cache") as cache_mock:
+        cache_mock.get_many.side_effect = lambda keys: dict.fromkeys(keys, 1)
+
+        assert views_map.is_cached(trip)
+
+
+def test_is_cached_missing_level():
+    trip = SimpleNamespace(pk=7, cache_version=3)
+
+    with patch.object(views_map, "cache") as cache_mock:
+        cache_mock.get_many.return_value = {"geojson_7_v3": 1}
+
+        assert not views_map.is_cached(trip)
+
+
+@patch("project.maps.utils.statistic_service.set_statistic")
+@patch("project.maps.utils.views_map.build_cache")
+def test_warm_cache(build_mock, statistic_mock):
+    trip = SimpleNamespace(pk=7, cache_version=3)
+
+    views_map.warm_cache(trip)
+
+    assert [c.args[1] for c in build_mock.call_args_list] == [
+        "geojson_7_v3_low",
+        "geojson_7_v3_medium",
+        "geojson_7_v3",
+    ]
+    statistic_mock.assert_called_once_with(trip)
+
+
+def test_geo_json_urls():
+    trip = TripFactory()
+
+    actual = views_map.get_geo_json_urls(trip)
+
+    assert list(actual) == ["low", "medium", "high"]
+    assert actual["low"] == f"/{trip.slug}/tracks.geojson?level=low"
+
+
+def test_encode_decode():
+    actual = views_map.encode(b'{"type":"FeatureCollection"}')
+
+    assert views_map.decode(actual) == b'{"type":"FeatureCollection"}'
+
+
+def test_encode_is_deterministic():
+    assert views_map.encode(b"x")["gzip"] == views_map.encode(b"x")["gzip"]
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expect",
+    [
+        ("gzip, deflate, br", "gzip"),
+        ("deflate", None),
+        ("", None),
+    ],
+)
+def test_choose_encoding_without_brotli(monkeypatch, accept_encoding, expect):
+    monkeypatch.setattr(views_map, "brotli", None)
+
+    assert views_map.choose_encoding(accept_encoding) == expect
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expect",
+    [
+        ("gzip, deflate, br", "br"),
+        ("gzip", "gzip"),
+        ("deflate", None),
+    ],
+)
+def test_choose_encoding_with_brotli(monkeypatch, accept_encoding, expect):
+    monkeypatch.setattr(views_map, "brotli", object())
+
+    assert views_map.choose_encoding(accept_encoding) == expect
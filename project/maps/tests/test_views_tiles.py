@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import pytest
+
+from ..factories import TrackFactory, TripFactory
+from ..utils import views_tiles
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.mark.parametrize(
+    "z, x, y, expect",
+    [
+        (0, 0, 0, True),
+        (2, 3, 3, True),
+        (2, 4, 0, False),
+        (2, 0, 4, False),
+        (23, 0, 0, False),
+    ],
+)
+def test_valid_tile(z, x, y, expect):
+    assert views_tiles.is_valid_tile(z, x, y) == expect
+
+
+def test_cache_key():
+    trip = SimpleNamespace(pk=7)
+
+    actual = views_tiles.generate_cache_key(trip, "7-1-2", 3, 4, 5)
+
+    assert actual == "mvt_7_7-1-2_3_4_5"
+
+
+def test_tiles_url():
+    trip = TripFactory()
+
+    actual = views_tiles.get_tiles_url(trip)
+
+    assert actual == f"/{trip.slug}/tiles/{{z}}/{{x}}/{{y}}.mvt?v={trip.pk}-0"
+
+
+def test_context_small_trip(settings):
+    settings.MVT_TRACKS_THRESHOLD = 1
+    trip = TripFactory()
+    TrackFactory(trip=trip)
+
+    actual = views_tiles.create_context(trip)
+
+    assert actual == {"tiles_url": None}
+
+
+def test_context_big_trip(settings):
+    settings.MVT_TRACKS_THRESHOLD = 1
+    trip = TripFactory()
+    TrackFactory.create_batch(2, trip=trip)
+
+    actual = views_tiles.create_context(trip)
+
+    assert actual["tiles_url"]
+
+
+def test_tile_with_track():
+    trip = TripFactory()
+    TrackFactory(trip=trip)
+
+    actual = views_tiles.create_tile(trip, 0, 0, 0)
+
+    assert actual
+
+
+def test_empty_tile():
+    trip = TripFactory()
+
+    actual = views_tiles.create_tile(trip, 0, 0, 0)
+
+    assert actual == b""
@@ -0,0 +1,127 @@
+from datetime import date, timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from mock import patch
+
+from ..factories import TripFactory
+
+pytestmark = pytest.mark.django_db
+
+COMMAND = "project.maps.management.commands.warm_cache"
+
+
+def run(*args):
+    out = StringIO()
+    call_command("warm_cache", *args, stdout=out)
+
+    return out.getvalue()
+
+
+@pytest.fixture(name="warm_mock")
+def fixture_warm_mock():
+    with patch(f"{COMMAND}.warm_cache") as mock:
+        yield mock
+
+
+@patch(f"{COMMAND}.is_cached", return_value=True)
+def test_skips_cached_finished_trip(cached_mock, warm_mock):
+    TripFactory(title="Finished")
+
+    actual = run()
+
+    assert "finished: up to date, skipped" in actual
+    warm_mock.assert_not_called()
+
+
+@patch(f"{COMMAND}.is_cached", return_value=False)
+def test_warms_not_cached_finished_trip(cached_mock, warm_mock):
+    TripFactory(title="Finished")
+
+    actual = run()
+
+    assert "finished: " in actual
+    assert "skipped" not in actual
+    warm_mock.assert_called_once()
+
+
+@patch(f"{COMMAND}.is_cached", return_value=True)
+def test_warms_ongoing_trip(cached_mock, warm_mock):
+    today = date.today()
+    TripFactory(
+        title="Ongoing",
+        start_date=today - timedelta(days=1),
+        end_date=today + timedelta(days=1),
+    )
+
+    run()
+
+    warm_mock.assert_called_once()
+    cached_mock.assert_not_called()
+
+
+@patch(f"{COMMAND}.is_cached", return_value=True)
+def test_force(cached_mock, warm_mock):
+    TripFactory(title="Finished")
+
+    actual = run("--force")
+
+    assert "skipped" not in actual
+    warm_mock.assert_called_once()
+
+
+@patch(f"{COMMAND}.is_cached", return_value=False)
+def test_chosen_trips(cached_mock, warm_mock):
+    TripFactory(title="First")
+    TripFactory(title="Second")
+
+    actual = run("second")
+
+    assert "second: " in actual
+    assert "first: " not in actual
+    assert warm_mock.call_args.args[0].slug == "second"
+
+
+@patch(f"{COMMAND}.is_cached", return_value=False)
+def test_per_trip_output(cached_mock, warm_mock):
+    TripFactory(title="First")
+    TripFactory(title="Second")
+
+    actual = run("--workers", "2")
+
+    lines = actual.splitlines()
+    assert sorted(line.split(":")[0] for line in lines[:2]) == ["first", "second"]
+    assert all(line.endswith(" sec") for line in lines[:2])
+    assert "warmed cache of 2 trips" in lines[2]
+
+
+@pytest.mark.parametrize("workers", ["0", "17"])
+def test_workers_out_of_range(workers, warm_mock):
+    with pytest.raises(CommandError, match="between 1 and 16"):
+        run("--workers", workers)
+
+    warm_mock.assert_not_called()
+
+
+@pytest.mark.parametrize("workers", ["1", "16"])
+@patch(f"{COMMAND}.is_cached", return_value=False)
+def test_workers_in_range(cached_mock, workers, warm_mock):
+    TripFactory(title="Finished")
+
+    run("--workers", workers)
+
+    warm_mock.assert_called_once()
+
+
+@patch(f"{COMMAND}.is_cached", return_value=False)
+def test_failed_trip(cached_mock, warm_mock):
+    TripFactory(title="Finished")
+    warm_mock.side_effect = ValueError("boom")
+    err = StringIO()
+
+    with pytest.raises(CommandError, match="1 of 1 trips failed"):
+        call_command("warm_cache", stdout=StringIO(), stderr=err)
+
+    assert "finished: can't set cache - boom" in err.getvalue()
@@ -27,12 +27,48 @@ urlpatterns = [
         views.SaveNewTracks.as_view(),
         name="update_tracks",
     ),
+    path(
+        "utils/update_changed_tracks/<slug:trip>/",
+        views.UpdateChangedTracks.as_view(),
+        name="update_changed_tracks",
+    ),
     path(
         "utils/update_all_tracks/<slug:trip>/",
         views.RewriteAllTracks.as_view(),
         name="update_all_tracks",
     ),
+    path("bbox.geojson", views.BboxGeoJson.as_view(), name="bbox"),
     path("<slug:trip>/", views.Map.as_view(), name="index"),
+    path(
+        "<slug:trip>/bbox.geojson",
+        views.BboxGeoJson.as_view(),
+        name="trip_bbox",
+    ),
+    path(
+        "<slug:trip>/daily.json",
+        views.DailyStatistic.as_view(),
+        name="daily_statistic",
+    ),
+    path(
+        "<slug:trip>/profile.json",
+        views.TripProfile.as_view(),
+        name="trip_profile",
+    ),
+    path(
+        "<slug:trip>/tracks/<int:pk>/profile.json",
+        views.TrackProfile.as_view(),
+        name="track_profile",
+    ),
+    path(
+        "<slug:trip>/tracks.geojson",
+        views.TracksGeoJson.as_view(),
+        name="tracks_geojson",
+    ),
+    path(
+        "<slug:trip>/tiles/<int:z>/<int:x>/<int:y>.mvt",
+        views.TracksTile.as_view(),
+        name="tiles",
+    ),
     path("<slug:trip>/posts/", views.Posts.as_view(), name="posts"),
     path("<slug:trip>/qty/", views.CommentQty.as_view(), name="comment_qty"),
     path(
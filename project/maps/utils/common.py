@@ -1,6 +1,11 @@
+import contextlib
 import functools
+import os
 import time
 from datetime import date
+from pathlib import Path
+
+from django.conf import settings
 
 from ..models import Trip
 
@@ -31,3 +36,44 @@ def get_trip() -> Trip:
         return None
 
     return trip
+
+
+def is_finished(trip) -> bool:
+    return trip.end_date < date.today()
+
+
+def generate_cache_timeout(trip):
+    """
+    Cache keys contain the trip's cache_version, nothing deletes the keys
+    of superseded versions, they expire. Finished trips rarely change,
+    so they are kept longer.
+    """
+    current_date = date.today()
+    return (
+        settings.GEOJSON_CACHE_TIMEOUTS["ongoing_trip"]
+        if trip.start_date <= current_date <= trip.end_date
+        else settings.GEOJSON_CACHE_TIMEOUTS["past_trip"]
+    )
+
+
+def get_change_stamp(updated) -> int:
+    """
+    Returns microseconds of the change time, keys containing it
+    never get stale.
+    """
+    return int(updated.timestamp() * 1_000_000)
+
+
+@contextlib.contextmanager
+def write_atomic(path: Path):
+    """
+    Yields a binary file, which replaces the path once it is written,
+    readers never see a half written file.
+    """
+    tmp = path.with_name(f".{path.name}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            yield f
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
@@ -0,0 +1,99 @@
+from pathlib import Path
+
+from django.conf import settings
+
+from .. import models
+from .common import is_finished, write_atomic
+from .views_map import create_geo_json, encode, get_detail_levels
+
+FOLDER = "geojson"
+
+# file suffixes of the precompressed siblings, as nginx gzip_static/brotli_static
+# expect them
+SUFFIXES = {"gzip": ".gz", "br": ".br"}
+
+
+class FreezeServiceError(Exception):
+    pass
+
+
+def get_file_name(trip, level=None):
+    """
+    Returns geojson/<trip_pk>/<cache_version>[_<level>].geojson,
+    the name changes with every change of the trip, so it can be cached forever.
+    """
+    name = str(trip.cache_version)
+
+    if settings.GEOJSON_DETAIL_LEVELS.get(level):
+        name = f"{name}_{level}"
+
+    return f"{FOLDER}/{trip.pk}/{name}.geojson"
+
+
+def is_frozen(trip):
+    return trip.frozen_version is not None and trip.frozen_version == trip.cache_version
+
+
+def write_file(path: Path, data: bytes) -> None:
+    with write_atomic(path) as f:
+        f.write(data)
+
+
+def remove_superseded(folder: Path, names: set) -> None:
+    for path in folder.iterdir():
+        if path.is_file() and path.name not in names:
+            path.unlink()
+
+
+def freeze_trip(trip):
+    """
+    Writes GeoJSON of every level of detail of a finished trip into MEDIA_ROOT,
+    with .gz and .br siblings, and marks the trip as frozen at its cache version.
+    """
+    if not is_finished(trip):
+        raise FreezeServiceError(f"{trip.title} is not finished yet")
+
+    folder = Path(settings.MEDIA_ROOT) / FOLDER / str(trip.pk)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    names = set()
+    for level in get_detail_levels():
+        data = create_geo_json(trip, level)
+        path = Path(settings.MEDIA_ROOT) / get_file_name(trip, level)
+
+        write_file(path, data)
+        names.add(path.name)
+
+        for encoding, encoded in encode(data).items():
+            write_file(path.with_name(f"{path.name}{SUFFIXES[encoding]}"), encoded)
+            names.add(f"{path.name}{SUFFIXES[encoding]}")
+
+    remove_superseded(folder, names)
+
+    # tracks changed while writing, the files are already superseded
+    frozen = models.Trip.objects.filter(
+        pk=trip.pk, cache_version=trip.cache_version
+    ).update(frozen_version=trip.cache_version)
+
+    if frozen:
+        trip.frozen_version = trip.cache_version
+
+    return bool(frozen)
+
+
+def get_urls(trip):
+    """
+    Returns {level: url} of the trip's static GeoJSON files.
+    """
+    return {
+        level: f"{settings.MEDIA_URL}{get_file_name(trip, level)}"
+        for level in get_detail_levels()
+    }
+
+
+def create_context(trip):
+    # frozen trips are loaded from static files, without Django and the cache
+    if not is_frozen(trip):
+        return {}
+
+    return {"geojson_urls": get_urls(trip), "bbox_url": None}
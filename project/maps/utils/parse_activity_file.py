@@ -11,12 +11,14 @@ def get_activity_content(file_path: Path) -> Dict:
     """
     try:
         return json.loads(file_path.open().read())
-    except json.JSONDecodeError:
+    except (OSError, json.JSONDecodeError):
         return {}
 
 
 def get_statistic(activity_file: Path) -> Dict:
     activity = get_activity_content(activity_file)
+    if not activity:
+        return {}
 
     # old activities have 'movingDuration': None
     total_time = activity.get("movingDuration") or activity.get("duration")
@@ -1,83 +1,136 @@
-import itertools as it
-from datetime import datetime
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional
 
 import fitdecode
+import numpy as np
 from django.contrib.gis.geos import LineString
-from django.utils import timezone
-from parser import parse_coordinates, parse_timestamp
-
-
-def get_track_path(fit_file_path):
-    try:
-        return LineString(parse_coordinates(str(fit_file_path)))
-    except Exception as e:
-        print(f"Something wrong with rust parser: {e}")
-        return parse_coordinates_pyton(fit_file_path)
-
-
-def get_track_date(fit_file_path):
-    try:
-        return parse_timestamp(str(fit_file_path))
-    except Exception as e:
-        print(f"Something wrong with rust parser: {e}")
-        return parse_timestamp_pyton(fit_file_path)
-
-
-def parse_coordinates_pyton(fit_file_path):
-    coordinates = []
-    to_deg = lambda x: round(x * (180.0 / 2**31), 5)
-
-    try:
-        with fitdecode.FitReader(fit_file_path) as fit:
-            records = it.filterfalse(
-                lambda f: (
-                    f.frame_type != fitdecode.FIT_FRAME_DATA
-                    or f.name != "record"
-                    or not all(
-                        f.has_field(field)
-                        for field in ("position_lat", "position_long")
-                    )
-                ),
-                fit,
-            )
-
-            # Convert semicircles to degrees rounded to 5 decimals
-            #  using map for speed
-            coordinates = list(
-                zip(
-                    map(
-                        to_deg,
-                        (frame.get_value("position_long") for frame in records),
-                    ),
-                    map(
-                        to_deg,
-                        (frame.get_value("position_lat") for frame in records),
-                    ),
-                )
-            )
-
-            return LineString(coordinates, srid=4326)
-
-    except Exception:
-        return None
-
-
-def parse_timestamp_pyton(fit_file_path):
-    def get_timestamp(frame):
-        """Helper to extract timestamp from a frame."""
-        if frame.name in ("file_id", "session"):
-            return frame.get_value("time_created") or frame.get_value("start_time")
-        return frame.get_value("timestamp") if frame.name == "record" else None
-
-    try:
-        with fitdecode.FitReader(fit_file_path) as fit:
-            for frame in fit:
-                if frame.frame_type != fitdecode.FIT_FRAME_DATA:
-                    continue
-                timestamp = get_timestamp(frame)
-                if timestamp and isinstance(timestamp, datetime):
-                    return timestamp
-            return datetime.now(timezone.utc)
-
-    except Exception:
-        return datetime.now(timezone.utc)
+
+# bump when parse_track_points output changes,
+# so stored tracks are parsed again
+PARSER_VERSION = 3
+
+SEMICIRCLES_TO_DEG = 180.0 / 2**31
+
+# record fields of the track points columns, in order of preference
+POINT_FIELDS = {
+    "altitude": ("enhanced_altitude", "altitude"),
+    "heart_rate": ("heart_rate",),
+    "cadence": ("cadence",),
+    "speed": ("enhanced_speed", "speed"),
+    "temperature": ("temperature",),
+}
+
+
+class ParsedTrack(NamedTuple):
+    # per point data stays in the points columns, so parse workers
+    # send back only this much
+    path: Optional[LineString]
+    date: datetime
+    activity_type: str = "cycling"
+
+
+class FitRecords(NamedTuple):
+    date: Optional[datetime]
+    # semicircles of the records with coordinates
+    lon: array
+    lat: array
+    timestamps: List[Optional[datetime]]
+    # values of the requested fields, per record with coordinates
+    columns: Dict[str, list]
+
+
+def get_timestamp(frame):
+    """Helper to extract timestamp from a frame."""
+    if frame.name in ("file_id", "session"):
+        return frame.get_value("time_created") or frame.get_value("start_time")
+    return frame.get_value("timestamp") if frame.name == "record" else None
+
+
+def get_first_value(values, fields):
+    for field in fields:
+        value = values.get(field)
+        if value is not None:
+            return value
+    return None
+
+
+def read_records(fit_file, fields=None) -> FitRecords:
+    """
+    Reads the records with coordinates in a single pass over the FIT frames.
+    Semicircles go into int arrays, fields are {column: FIT fields in order
+    of preference}. Fit file is a path or a file object.
+    """
+    fields = fields or {}
+
+    date = None
+    lon = array("i")
+    lat = array("i")
+    timestamps = []
+    columns = {name: [] for name in fields}
+
+    with fitdecode.FitReader(fit_file) as fit:
+        for frame in fit:
+            if frame.frame_type != fitdecode.FIT_FRAME_DATA:
+                continue
+
+            if frame.name != "record":
+                if date is None:
+                    timestamp = get_timestamp(frame)
+                    if timestamp and isinstance(timestamp, datetime):
+                        date = timestamp
+                continue
+
+            # one pass over the fields instead of a search per get_value
+            values = {field.name: field.value for field in frame.fields}
+
+            timestamp = values.get("timestamp")
+            if date is None and isinstance(timestamp, datetime):
+                date = timestamp
+
+            position_lat = values.get("position_lat")
+            position_long = values.get("position_long")
+            if position_lat is None or position_long is None:
+                continue
+
+            lat.append(position_lat)
+            lon.append(position_long)
+            timestamps.append(timestamp)
+
+            for name, candidates in fields.items():
+                columns[name].append(get_first_value(values, candidates))
+
+    return FitRecords(date, lon, lat, timestamps, columns)
+
+
+def to_degrees(semicircles: array) -> np.ndarray:
+    return np.frombuffer(semicircles, dtype=np.intc) * SEMICIRCLES_TO_DEG
+
+
+def to_coordinates(records: FitRecords) -> np.ndarray:
+    """
+    Returns (N, 2) array of longitudes and latitudes rounded to 5 decimals.
+    """
+    return np.column_stack((to_degrees(records.lon), to_degrees(records.lat))).round(5)
+
+
+def parse_track_points(fit_file) -> tuple[ParsedTrack, Dict[str, list]]:
+    """
+    Returns the track and its per record columns read in a single pass,
+    records without coordinates are skipped in both of them.
+    Fit file is a path or a file object.
+    """
+    records = read_records(fit_file, POINT_FIELDS)
+    coordinates = to_coordinates(records)
+
+    track = ParsedTrack(
+        LineString(coordinates, srid=4326) if len(coordinates) > 1 else None,
+        records.date or datetime.now(timezone.utc),
+    )
+    points = {
+        "timestamp": records.timestamps,
+        "lat": to_degrees(records.lat),
+        "lon": to_degrees(records.lon),
+    } | records.columns
+
+    return track, points
@@ -1,9 +1,12 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Dict
 
 from django.contrib.gis.geos import LineString
 from lxml import etree
 
+from .parse_fit_file import ParsedTrack
+
 NAMESPACES = {
     "ns": "http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2",
     "ns3": "http://www.garmin.com/xmlschemas/ActivityExtension/v2",
@@ -13,9 +16,23 @@ TRACKPOINT_TAG = (
     "{http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2}Trackpoint"
 )
 
+ACTIVITY_TAG = "{http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2}Activity"
+ID_TAG = "{http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2}Id"
+
 LON = "ns:LongitudeDegrees/text()"
 LAT = "ns:LatitudeDegrees/text()"
 
+# Trackpoint children of the track points columns
+POINT_FIELDS = {
+    "altitude": "ns:AltitudeMeters",
+    "heart_rate": "ns:HeartRateBpm/ns:Value",
+    "cadence": "ns:Cadence",
+    "speed": "ns:Extensions/ns3:TPX/ns3:Speed",
+}
+
+# Activity Sport attribute to Track.activity_type
+SPORTS = {"Biking": "cycling", "Running": "running"}
+
 
 def get_track_path(file_path: Path) -> LineString:
     coordinates = []
@@ -52,3 +69,58 @@ def get_track_date(file_path: Path) -> datetime:
         return datetime.now()
 
     return datetime.fromisoformat(activity_id.text.replace("Z", "+00:00"))
+
+
+def parse_time(text):
+    return datetime.fromisoformat(text.replace("Z", "+00:00"))
+
+
+def parse_track_points(source) -> tuple[ParsedTrack, Dict[str, list]]:
+    """
+    Returns the track and its per trackpoint columns read in a single pass,
+    trackpoints without a position are skipped in both of them.
+    TCX has no temperature.
+    """
+    coordinates = []
+    points = {"timestamp": [], "lat": [], "lon": [], "temperature": []}
+    points |= {name: [] for name in POINT_FIELDS}
+    date = None
+    activity_type = None
+
+    context = etree.iterparse(source, tag=(ACTIVITY_TAG, ID_TAG, TRACKPOINT_TAG))
+    for _, elem in context:
+        if elem.tag == ID_TAG:
+            if date is None and elem.text:
+                date = parse_time(elem.text)
+            continue
+
+        if elem.tag == ACTIVITY_TAG:
+            if activity_type is None:
+                activity_type = SPORTS.get(elem.get("Sport"), "cycling")
+            continue
+
+        pos = elem.find("ns:Position", NAMESPACES)
+        lon = pos is not None and pos.findtext("ns:LongitudeDegrees", None, NAMESPACES)
+        lat = pos is not None and pos.findtext("ns:LatitudeDegrees", None, NAMESPACES)
+        if lon and lat:
+            time = elem.findtext("ns:Time", None, NAMESPACES)
+
+            coordinates.append((round(float(lon), 5), round(float(lat), 5)))
+            points["timestamp"].append(parse_time(time) if time else None)
+            points["lat"].append(float(lat))
+            points["lon"].append(float(lon))
+            points["temperature"].append(None)
+
+            for name, field in POINT_FIELDS.items():
+                value = elem.findtext(field, None, NAMESPACES)
+                points[name].append(float(value) if value else None)
+
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]  # Clear parent to reduce memory
+
+    timestamps = points["timestamp"]
+    path = LineString(coordinates, srid=4326) if len(coordinates) > 1 else None
+    date = date or next(filter(None, timestamps), None) or datetime.now(timezone.utc)
+
+    return ParsedTrack(path, date, activity_type or "cycling"), points
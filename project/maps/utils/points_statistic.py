@@ -0,0 +1,168 @@
+from typing import Dict, Optional
+
+import numpy as np
+
+from .track_points import MISSING_TIME, TrackPoints, haversine
+
+# slower steps are standing, they don't count into the moving time
+MOVING_SPEED = 2.0  # km/h
+
+# climbs and descents smaller than this are altitude noise
+ELEVATION_THRESHOLD = 5.0  # meters
+
+# max speed is measured over this many seconds, single GPS jumps are ignored
+MAX_SPEED_WINDOW = 5
+
+
+def mean(values: np.ndarray, exclude_zeros=False) -> Optional[float]:
+    values = values[np.isfinite(values)]
+    if exclude_zeros:
+        values = values[values > 0]
+
+    return float(values.mean()) if values.size else None
+
+
+def maximum(values: np.ndarray) -> Optional[float]:
+    values = values[np.isfinite(values)]
+    return float(values.max()) if values.size else None
+
+
+def minimum(values: np.ndarray) -> Optional[float]:
+    values = values[np.isfinite(values)]
+    return float(values.min()) if values.size else None
+
+
+def get_extremes(altitude: np.ndarray) -> np.ndarray:
+    """
+    Returns the first, the last and every turning point of the altitude,
+    points in the middle of a climb or a descent can't change the totals.
+    """
+    steps = np.diff(altitude)
+    changes = np.flatnonzero(steps)
+    if not changes.size:
+        return altitude[[0, -1]]
+
+    # where the direction of the non-flat steps changes
+    signs = np.sign(steps[changes])
+    turns = changes[1:][signs[1:] != signs[:-1]]
+
+    return np.concatenate(([altitude[0]], altitude[turns], [altitude[-1]]))
+
+
+def get_ascent_descent(altitude: np.ndarray, threshold=ELEVATION_THRESHOLD):
+    """
+    Returns meters of ascent and descent, counting only direction changes
+    of at least the threshold. Extremes are found with numpy, so the loop
+    runs over turning points only.
+    """
+    altitude = altitude[np.isfinite(altitude)].astype(np.float64)
+    if altitude.size < 2:
+        return 0.0, 0.0
+
+    extremes = get_extremes(altitude).tolist()
+
+    ascent = descent = 0.0
+    low = high = pivot = extreme = extremes[0]
+    rising = None
+    for value in extremes[1:]:
+        if rising is None:
+            low, high = min(low, value), max(high, value)
+            if value - low >= threshold:
+                rising, pivot, extreme = True, low, value
+            elif high - value >= threshold:
+                rising, pivot, extreme = False, high, value
+        elif rising:
+            if value > extreme:
+                extreme = value
+            elif extreme - value >= threshold:
+                ascent += extreme - pivot
+                rising, pivot, extreme = False, extreme, value
+        else:
+            if value < extreme:
+                extreme = value
+            elif value - extreme >= threshold:
+                descent += pivot - extreme
+                rising, pivot, extreme = True, extreme, value
+
+    if rising:
+        ascent += extreme - pivot
+    elif rising is False:
+        descent += pivot - extreme
+
+    return ascent, descent
+
+
+def get_max_speed(points: TrackPoints, distance, timestamp) -> Optional[float]:
+    """
+    Returns km/h, recorded by the device or averaged over MAX_SPEED_WINDOW
+    points of the path.
+    """
+    if (speed := maximum(np.asarray(points.speed, dtype=np.float64))) is not None:
+        return speed * 3.6
+
+    if distance.size <= MAX_SPEED_WINDOW:
+        return None
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speeds = (
+            (distance[MAX_SPEED_WINDOW:] - distance[:-MAX_SPEED_WINDOW])
+            / (timestamp[MAX_SPEED_WINDOW:] - timestamp[:-MAX_SPEED_WINDOW])
+            * 3600
+        )
+
+    return maximum(speeds)
+
+
+def get_statistic(points: Optional[TrackPoints]) -> Dict:
+    """
+    Returns Statistic fields computed from the track points,
+    empty if there are not enough of them.
+    """
+    if points is None:
+        return {}
+
+    timed = points.timestamp != MISSING_TIME
+    if np.count_nonzero(timed) < 2:
+        return {}
+
+    timestamp = points.timestamp[timed].astype(np.float64)
+    steps = haversine(points.lat[timed], points.lon[timed])
+
+    distance = np.zeros(timestamp.size, dtype=np.float64)
+    np.cumsum(steps, out=distance[1:])
+
+    # steps fast enough are moving, paused recording gives slow steps
+    seconds = np.diff(timestamp)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        moving = (seconds > 0) & (steps / seconds * 3600 >= MOVING_SPEED)
+
+    total_km = float(distance[-1])
+    total_time = float(seconds[moving].sum())
+    ascent, descent = get_ascent_descent(np.asarray(points.altitude))
+
+    return {
+        "total_km": total_km,
+        "total_time_seconds": total_time,
+        "avg_speed": total_km / total_time * 3600 if total_time else None,
+        "max_speed": get_max_speed(points, distance, timestamp),
+        "calories": None,
+        "avg_cadence": mean(np.asarray(points.cadence), exclude_zeros=True),
+        "avg_heart": mean(np.asarray(points.heart_rate)),
+        "max_heart": maximum(np.asarray(points.heart_rate)),
+        "avg_temperature": mean(np.asarray(points.temperature)),
+        "ascent": ascent,
+        "descent": descent,
+        "min_altitude": minimum(np.asarray(points.altitude)),
+        "max_altitude": maximum(np.asarray(points.altitude)),
+    }
+
+
+def fill_gaps(summary: Dict, computed: Dict) -> Dict:
+    """
+    Returns the summary statistic with its missing values
+    taken from the statistic computed from the points.
+    """
+    return computed | {
+        key: computed.get(key) if value is None else value
+        for key, value in summary.items()
+    }
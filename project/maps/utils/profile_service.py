@@ -0,0 +1,225 @@
+import contextlib
+
+import numpy as np
+import orjson
+from django.conf import settings
+from django.core.cache import cache
+
+from . import statistic_service, track_points
+from .common import generate_cache_timeout, get_change_stamp
+
+# a triangle needs the first, the last and at least one point between them
+MIN_POINTS = 3
+
+
+def generate_track_cache_key(track, points):
+    stamp = get_change_stamp(track.updated)
+    return f"profile_track_{track.pk}_{stamp}_{points}"
+
+
+def generate_trip_cache_key(trip, points):
+    return f"profile_trip_{trip.pk}_v{trip.cache_version}_{points}"
+
+
+def get_points(value) -> int:
+    """
+    Returns the requested number of profile points within the allowed range,
+    the default one if the value is not a number.
+    """
+    try:
+        points = int(value)
+    except (TypeError, ValueError):
+        return settings.PROFILE_POINTS["default"]
+
+    return min(max(points, MIN_POINTS), settings.PROFILE_POINTS["max"])
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Returns indices of the points kept by Largest-Triangle-Three-Buckets.
+    Bucket averages are computed for all buckets at once, only picking
+    the point, which depends on the one picked before, loops over buckets.
+    """
+    size = len(x)
+    if threshold >= size or threshold < MIN_POINTS:
+        return np.arange(size)
+
+    # the first and the last points are kept, the others are split into buckets
+    edges = np.linspace(1, size - 1, threshold - 1).astype(np.int64)
+    counts = np.diff(edges)
+
+    avg_x = np.append(np.add.reduceat(x[: size - 1], edges[:-1]) / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[: size - 1], edges[:-1]) / counts, y[-1])
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, size - 1
+
+    picked = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+
+        # doubled areas of the triangles with the point picked before
+        # and the average of the next bucket
+        areas = np.abs(
+            (x[picked] - avg_x[bucket + 1]) * (y[start:end] - y[picked])
+            - (x[picked] - x[start:end]) * (avg_y[bucket + 1] - y[picked])
+        )
+        picked = start + int(np.argmax(areas))
+        indices[bucket + 1] = picked
+
+    return indices
+
+
+def get_speed(points, distance) -> np.ndarray:
+    """
+    Returns km/h at every point, computed from the distance and timestamps
+    if the device didn't record the speed.
+    """
+    speed = np.asarray(points.speed, dtype=np.float64) * 3.6
+    if np.isfinite(speed).any():
+        return speed
+
+    timestamp = np.asarray(points.timestamp, dtype=np.float64)
+    timestamp[timestamp == track_points.MISSING_TIME] = np.nan
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        step = np.diff(distance) / np.diff(timestamp) * 3600
+
+    # paused or missing timestamps give no speed
+    step[~np.isfinite(step)] = np.nan
+    return np.concatenate(([np.nan], step))
+
+
+def downsample(x, y, points, decimals) -> np.ndarray:
+    """
+    Returns (N, 2) array of [distance, value] without the missing values,
+    reduced to the given number of points.
+    """
+    finite = np.isfinite(y)
+    x, y = x[finite], y[finite]
+
+    indices = lttb(x, y, points)
+    return np.column_stack((x[indices].round(3), y[indices].round(decimals)))
+
+
+def create_profile(series, points) -> dict:
+    """
+    Series is a list of (distance, altitude, speed) arrays, one per track,
+    distance starts from zero in every one of them.
+    """
+    distance, altitude, speed = [], [], []
+    starts = []
+
+    offset = 0.0
+    for track_distance, track_altitude, track_speed in series:
+        starts.append(round(offset, 3))
+
+        distance.append(track_distance + offset)
+        altitude.append(track_altitude)
+        speed.append(track_speed)
+
+        if len(track_distance):
+            offset += track_distance[-1]
+
+    if not distance:
+        return {"elevation": [], "speed": [], "starts": starts}
+
+    distance = np.concatenate(distance)
+
+    return {
+        "elevation": downsample(distance, np.concatenate(altitude), points, 1),
+        "speed": downsample(distance, np.concatenate(speed), points, 1),
+        "starts": starts,
+    }
+
+
+def read_track(track):
+    """
+    Returns (distance, altitude, speed) arrays of the track,
+    None if its points are not stored.
+    """
+    points = track_points.load_track(track)
+    if points is None:
+        return None
+
+    distance = track_points.get_distance(points)
+
+    return (
+        distance,
+        np.asarray(points.altitude, dtype=np.float64),
+        get_speed(points, distance),
+    )
+
+
+def create_track_statistic(track) -> dict | None:
+    with contextlib.suppress(AttributeError):
+        return {
+            "total_km": track.stats.total_km,
+            "total_time_seconds": track.stats.total_time_seconds,
+            "ascent": track.stats.ascent,
+            "descent": track.stats.descent,
+            "max_speed": track.stats.max_speed,
+        }
+
+    return None
+
+
+def create_track_profile(track, points) -> bytes:
+    series = [data] if (data := read_track(track)) is not None else []
+
+    profile = {
+        "track": track.pk,
+        "title": track.title,
+        "date": track.date,
+        "statistic": create_track_statistic(track),
+    } | create_profile(series, points)
+
+    return orjson.dumps(profile, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def create_trip_profile(trip, points) -> bytes:
+    tracks = trip.tracks.order_by("date").only("pk", "title", "trip_id")
+
+    profile_tracks = []
+    series = []
+    for track in tracks:
+        data = read_track(track)
+        if data is None:
+            continue
+
+        profile_tracks.append(track.pk)
+        series.append(data)
+
+    profile = {
+        "trip": trip.slug,
+        "tracks": profile_tracks,
+        "statistic": statistic_service.get_totals(trip),
+    } | create_profile(series, points)
+
+    return orjson.dumps(profile, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def get_track_profile(track, points) -> bytes:
+    cache_key = generate_track_cache_key(track, points)
+
+    data = cache.get(cache_key)
+    if data is None:
+        data = create_track_profile(track, points)
+        cache.set(
+            key=cache_key,
+            value=data,
+            timeout=settings.GEOJSON_CACHE_TIMEOUTS["feature"],
+        )
+
+    return data
+
+
+def get_trip_profile(trip, points) -> bytes:
+    cache_key = generate_trip_cache_key(trip, points)
+
+    data = cache.get(cache_key)
+    if data is None:
+        data = create_trip_profile(trip, points)
+        cache.set(key=cache_key, value=data, timeout=generate_cache_timeout(trip))
+
+    return data
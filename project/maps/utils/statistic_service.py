@@ -1,27 +1,206 @@
 import datetime
+from zoneinfo import ZoneInfo
 
-from django.db.models import Sum
+import orjson
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    Count,
+    DateTimeField,
+    F,
+    FloatField,
+    Max,
+    Min,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce, Greatest, Least, TruncDate
 
 from .. import models
+from .common import generate_cache_timeout
 
 
-def get_statistic(trip):
-    total_km = 0.0
-    total_time = 0.0
-    total_ascent = 0.0
-    # total_descent = 0.0
+def generate_cache_key(trip):
+    return f"statistic_{trip.pk}_v{trip.cache_version}"
+
+
+def generate_daily_cache_key(trip):
+    return f"daily_statistic_{trip.pk}_v{trip.cache_version}"
+
+
+def aggregate_totals(trip) -> dict:
+    """
+    Returns TripStatistic fields computed from the trip's track statistics
+    in a single query.
+    """
+    return models.Statistic.objects.filter(track__trip__pk=trip.pk).aggregate(
+        total_km=Coalesce(Sum("total_km"), 0.0),
+        total_time_seconds=Coalesce(Sum("total_time_seconds"), 0.0),
+        ascent=Coalesce(Sum("ascent"), 0.0),
+        descent=Coalesce(Sum("descent"), 0.0),
+        track_count=Count("pk"),
+        max_speed=Max("max_speed"),
+        first_date=Min("track__date"),
+        last_date=Max("track__date"),
+    )
+
+
+def rebuild_trip_statistic(trip) -> None:
+    models.TripStatistic.objects.update_or_create(
+        trip=trip, defaults=aggregate_totals(trip)
+    )
+
+
+def add_trip_statistic(trip, statistics) -> None:
+    """
+    Adds statistics of new tracks to the trip's totals.
+    Totals are rebuilt if the trip has none yet.
+    """
+    if not statistics:
+        return
 
-    stats = models.Statistic.objects.filter(track__trip__pk=trip.pk)
+    speeds = [obj.max_speed for obj in statistics if obj.max_speed is not None]
+    dates = [obj.track.date for obj in statistics]
 
-    total_km = stats.aggregate(Sum("total_km"))["total_km__sum"]
-    total_time = stats.aggregate(Sum("total_time_seconds"))["total_time_seconds__sum"]
-    total_ascent = stats.aggregate(Sum("ascent"))["ascent__sum"]
-    # total_descent = stats.aggregate(Sum("descent"))["descent__sum"]
+    updated = models.TripStatistic.objects.filter(trip=trip).update(
+        total_km=F("total_km") + sum(obj.total_km or 0 for obj in statistics),
+        total_time_seconds=F("total_time_seconds")
+        + sum(obj.total_time_seconds or 0 for obj in statistics),
+        ascent=F("ascent") + sum(obj.ascent or 0 for obj in statistics),
+        descent=F("descent") + sum(obj.descent or 0 for obj in statistics),
+        track_count=F("track_count") + len(statistics),
+        # GREATEST and LEAST skip NULLs in PostgreSQL
+        max_speed=Greatest(
+            "max_speed", Value(max(speeds, default=None), output_field=FloatField())
+        ),
+        first_date=Least("first_date", Value(min(dates), output_field=DateTimeField())),
+        last_date=Greatest(
+            "last_date", Value(max(dates), output_field=DateTimeField())
+        ),
+    )
+
+    if not updated:
+        rebuild_trip_statistic(trip)
+
+
+def get_totals(trip):
+    # rollup row, or the same numbers straight from the track statistics
+    totals = models.TripStatistic.objects.filter(trip=trip).values().first()
+    if totals is None:
+        totals = aggregate_totals(trip)
 
     return {
-        "total_km": total_km,
-        "total_time": total_time,
+        "total_km": totals["total_km"],
+        "total_time": totals["total_time_seconds"],
+        "total_ascent": totals["ascent"],
+        "total_descent": totals["descent"],
+        "track_count": totals["track_count"],
+        "max_speed": totals["max_speed"],
+        "first_date": totals["first_date"],
+        "last_date": totals["last_date"],
+    }
+
+
+def set_statistic(trip):
+    totals = get_totals(trip)
+    cache.set(
+        key=generate_cache_key(trip),
+        value=totals,
+        timeout=generate_cache_timeout(trip),
+    )
+
+    return totals
+
+
+def get_statistic(trip):
+    totals = cache.get(generate_cache_key(trip))
+    if totals is None:
+        totals = set_statistic(trip)
+
+    return totals | {
         "total_days": ((datetime.date.today() - trip.start_date).days) + 1,
-        "total_ascent": total_ascent,
-        # "total_descent": total_descent,
     }
+
+
+def get_local_date(dt) -> datetime.date:
+    return dt.astimezone(ZoneInfo(settings.TIME_ZONE)).date()
+
+
+def aggregate_days(trip, dates=None):
+    """
+    Returns DailyStatistic fields of the trip grouped by the local date
+    of the tracks, only of the given dates if any.
+    """
+    stats = models.Statistic.objects.filter(track__trip__pk=trip.pk).annotate(
+        day=TruncDate("track__date", tzinfo=ZoneInfo(settings.TIME_ZONE))
+    )
+    if dates is not None:
+        stats = stats.filter(day__in=dates)
+
+    return (
+        stats.values("day")
+        .annotate(
+            total_km=Coalesce(Sum("total_km"), 0.0),
+            total_time_seconds=Coalesce(Sum("total_time_seconds"), 0.0),
+            ascent=Coalesce(Sum("ascent"), 0.0),
+            descent=Coalesce(Sum("descent"), 0.0),
+            track_count=Count("pk"),
+            max_speed=Max("max_speed"),
+        )
+        .order_by("day")
+    )
+
+
+def update_daily_statistic(trip, dates=None) -> None:
+    """
+    Recomputes the trip's DailyStatistic rows of the given local dates,
+    all of them if dates is None.
+    """
+    days = [
+        models.DailyStatistic(trip=trip, date=row.pop("day"), **row)
+        for row in aggregate_days(trip, dates)
+    ]
+
+    stale = models.DailyStatistic.objects.filter(trip=trip)
+    if dates is not None:
+        stale = stale.filter(date__in=dates)
+
+    with transaction.atomic():
+        stale.exclude(date__in=[day.date for day in days]).delete()
+        models.DailyStatistic.objects.bulk_create(
+            days,
+            update_conflicts=True,
+            update_fields=[
+                "total_km",
+                "total_time_seconds",
+                "ascent",
+                "descent",
+                "track_count",
+                "max_speed",
+            ],
+            unique_fields=["trip", "date"],
+        )
+
+
+def get_daily_statistic(trip) -> bytes:
+    """
+    Returns JSON list of the trip's daily totals, ordered by date.
+    """
+    cache_key = generate_daily_cache_key(trip)
+
+    data = cache.get(cache_key)
+    if data is None:
+        days = models.DailyStatistic.objects.filter(trip=trip).values(
+            "date",
+            "total_km",
+            "total_time_seconds",
+            "ascent",
+            "descent",
+            "track_count",
+            "max_speed",
+        )
+        data = orjson.dumps(list(days))
+        cache.set(key=cache_key, value=data, timeout=generate_cache_timeout(trip))
+
+    return data
@@ -0,0 +1,128 @@
+import gzip
+from pathlib import Path
+from typing import Callable, Dict, NamedTuple
+
+from . import parse_fit_file, parse_tcx_file
+from .parse_fit_file import ParsedTrack
+
+GZIP_SUFFIX = ".gz"
+GZIP_MAGIC = b"\x1f\x8b"
+
+# enough for the FIT header and the XML declaration with the TCX root element
+HEADER_SIZE = 1024
+
+# the track with its per point columns
+ParsedTrackPoints = tuple[ParsedTrack, Dict[str, list]]
+
+
+class TrackFormatError(Exception):
+    pass
+
+
+class TrackFormat(NamedTuple):
+    suffix: str
+    is_format: Callable[[bytes], bool]
+    parse_track_points: Callable[[Path, bool], ParsedTrackPoints]
+
+
+def is_fit(header: bytes) -> bool:
+    # ".FIT" data type of the 12 or 14 bytes long file header
+    return header[8:12] == b".FIT"
+
+
+def is_tcx(header: bytes) -> bool:
+    return b"<TrainingCenterDatabase" in header
+
+
+def parse_fit_track_points(file: Path, compressed: bool) -> ParsedTrackPoints:
+    # fitdecode reads file objects, gzipped files are decompressed as read
+    if not compressed:
+        return parse_fit_file.parse_track_points(file)
+
+    with gzip.open(file) as f:
+        return parse_fit_file.parse_track_points(f)
+
+
+def parse_tcx_track_points(file: Path, compressed: bool) -> ParsedTrackPoints:
+    if not compressed:
+        return parse_tcx_file.parse_track_points(str(file))
+
+    with gzip.open(file) as f:
+        return parse_tcx_file.parse_track_points(f)
+
+
+# ordered by preference, when the same activity is exported in several formats
+FORMATS = {
+    "fit": TrackFormat(".fit", is_fit, parse_fit_track_points),
+    "tcx": TrackFormat(".tcx", is_tcx, parse_tcx_track_points),
+}
+
+SUFFIXES = tuple(
+    suffix
+    for track_format in FORMATS.values()
+    for suffix in (track_format.suffix, f"{track_format.suffix}{GZIP_SUFFIX}")
+)
+
+
+def read_header(file: Path) -> tuple[bytes, bool]:
+    """
+    Returns the first bytes of the file, decompressed if it is gzipped,
+    and whether it is.
+    """
+    with open(file, "rb") as f:
+        header = f.read(HEADER_SIZE)
+
+    if not header.startswith(GZIP_MAGIC):
+        return header, False
+
+    with gzip.open(file) as f:
+        return f.read(HEADER_SIZE), True
+
+
+def get_format(file: Path) -> tuple[str, bool]:
+    """
+    Returns format name and whether the file is gzipped, told by magic bytes,
+    or by the file suffix if the content is not recognized.
+    """
+    try:
+        header, compressed = read_header(file)
+    except OSError:
+        header, compressed = b"", False
+
+    for name, track_format in FORMATS.items():
+        if track_format.is_format(header):
+            return name, compressed
+
+    name = file.name.lower()
+    compressed = name.endswith(GZIP_SUFFIX)
+    name = name.removesuffix(GZIP_SUFFIX)
+
+    for format_name, track_format in FORMATS.items():
+        if name.endswith(track_format.suffix):
+            return format_name, compressed
+
+    raise TrackFormatError(f"Unknown track file format: {file.name}")
+
+
+def get_files(directory: Path) -> Dict[str, Path]:
+    """
+    Returns {title: file} of the track files in the directory.
+    Title is the file name without the format suffix.
+    """
+    files = {}
+
+    # preferred formats go last and replace the others of the same title
+    for suffix in reversed(SUFFIXES):
+        for file in directory.glob(f"*{suffix}"):
+            files[file.name.removesuffix(suffix)] = file
+
+    return files
+
+
+def parse_track_points(file: Path) -> ParsedTrackPoints:
+    """
+    Returns the track and its points columns read in a single pass.
+    """
+    name, compressed = get_format(file)
+
+    return FORMATS[name].parse_track_points(file, compressed)
@@ -0,0 +1,183 @@
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+from django.conf import settings
+
+from .common import write_atomic
+
+FOLDER = "points"
+
+# mean Earth radius of the haversine distance
+EARTH_RADIUS_KM = 6371.0088
+
+# timestamps are seconds since the FIT epoch, int32 lasts until 2058
+FIT_EPOCH = int(datetime(1989, 12, 31, tzinfo=timezone.utc).timestamp())
+MISSING_TIME = -1
+
+# staging folders older than this were left by killed ingests
+STALE_STAGING = 24 * 60 * 60  # seconds
+
+
+class TrackPoints(NamedTuple):
+    """
+    Per point columns of a track, aligned with the vertices of Track.path.
+    Missing values are NaN, missing timestamps MISSING_TIME.
+    """
+
+    timestamp: np.ndarray  # int32, seconds since FIT_EPOCH
+    lat: np.ndarray  # float32, degrees
+    lon: np.ndarray  # float32, degrees
+    altitude: np.ndarray  # float32, meters
+    heart_rate: np.ndarray  # float32, bpm
+    cadence: np.ndarray  # float32, rpm
+    speed: np.ndarray  # float32, m/s
+    temperature: np.ndarray  # float32, °C
+
+
+COLUMNS = TrackPoints._fields
+
+DTYPES = {name: np.float32 for name in COLUMNS} | {"timestamp": np.int32}
+
+
+def get_folder(trip_pk) -> Path:
+    return Path(settings.MEDIA_ROOT) / FOLDER / str(trip_pk)
+
+
+def get_file(trip_pk, title) -> Path:
+    return get_folder(trip_pk) / f"{title}.npy"
+
+
+def create_staging(trip_pk) -> Path:
+    """
+    Returns a new folder for points files of tracks not committed yet.
+    It is inside the trip's folder, so they are moved in place atomically.
+    """
+    folder = get_folder(trip_pk)
+    folder.mkdir(parents=True, exist_ok=True)
+    remove_stale_staging(folder)
+
+    return Path(tempfile.mkdtemp(prefix=".staged-", dir=folder))
+
+
+def remove_stale_staging(folder: Path) -> None:
+    """
+    Removes staging folders of ingests killed before they could clean up,
+    recent ones can belong to an ingest still running.
+    """
+    limit = time.time() - STALE_STAGING
+    for staging in folder.glob(".staged-*"):
+        with contextlib.suppress(OSError):
+            if staging.stat().st_mtime < limit:
+                discard(staging)
+
+
+def publish(staging: Path, trip_pk) -> None:
+    """
+    Moves staged points files in place of the previous ones
+    and removes the staging folder.
+    """
+    for file in staging.glob("*.npy"):
+        os.replace(file, get_file(trip_pk, file.stem))
+
+    discard(staging)
+
+
+def discard(staging: Path) -> None:
+    shutil.rmtree(staging, ignore_errors=True)
+
+
+def to_fit_time(timestamp: Optional[datetime]) -> int:
+    if timestamp is None:
+        return MISSING_TIME
+    return int(timestamp.timestamp()) - FIT_EPOCH
+
+
+def get_dtype(size: int) -> np.dtype:
+    return np.dtype([(name, DTYPES[name], (size,)) for name in COLUMNS])
+
+
+def to_record(points: Dict[str, list]) -> np.ndarray:
+    """
+    Returns a single record holding an array per column, so every column
+    is contiguous and keeps its own dtype.
+    """
+    data = np.zeros((), dtype=get_dtype(len(points["lat"])))
+
+    data["timestamp"] = [to_fit_time(timestamp) for timestamp in points["timestamp"]]
+    for name in COLUMNS[1:]:
+        # None of the missing values becomes NaN
+        data[name] = np.array(points[name], dtype=np.float64)
+
+    return data
+
+
+def to_points(data: np.ndarray) -> TrackPoints:
+    return TrackPoints(*(data[name] for name in COLUMNS))
+
+
+def save(file: Path, points: Dict[str, list]) -> TrackPoints:
+    """
+    Returns the saved columns.
+    """
+    file.parent.mkdir(parents=True, exist_ok=True)
+    data = to_record(points)
+
+    with write_atomic(file) as f:
+        np.save(f, data)
+
+    return to_points(data)
+
+
+def load(file: Path) -> Optional[TrackPoints]:
+    """
+    Returns columns memory mapped from the file, without copying them,
+    None if the track has no points file or it is of an older layout.
+    """
+    try:
+        data = np.load(file, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+
+    if data.dtype.names != COLUMNS:
+        return None
+
+    return to_points(data)
+
+
+def haversine(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """
+    Returns kilometers between consecutive points, one less than the points.
+    """
+    lat = np.radians(lat, dtype=np.float64)
+    lon = np.radians(lon, dtype=np.float64)
+
+    a = (
+        np.sin(np.diff(lat) / 2) ** 2
+        + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def get_distance(points: TrackPoints) -> np.ndarray:
+    """
+    Returns kilometers from the start of the track at every point.
+    """
+    distance = np.zeros(len(points.lat), dtype=np.float64)
+    np.cumsum(haversine(points.lat, points.lon), out=distance[1:])
+    return distance
+
+
+def load_track(track) -> Optional[TrackPoints]:
+    return load(get_file(track.trip_id, track.title))
+
+
+def remove(trip_pk, titles) -> None:
+    for title in titles:
+        get_file(trip_pk, title).unlink(missing_ok=True)
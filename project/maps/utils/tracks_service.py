@@ -1,28 +1,103 @@
+import hashlib
+import pickle
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import batched
 from pathlib import Path
-from typing import Dict, List, Set
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set
 
 from django.conf import settings
+from django.db import transaction
 
-from ..models import Statistic, Track, Trip
+from ..models import Statistic, Track, TrackFile, Trip
 from ..utils.common import get_trip
-from . import parse_activity_file, parse_fit_file
+from . import (
+    parse_activity_file,
+    parse_fit_file,
+    points_statistic,
+    statistic_service,
+    track_formats,
+    track_points,
+)
+
+EXECUTORS = {"process": ProcessPoolExecutor, "thread": ThreadPoolExecutor}
+
+
+class ParseResult(NamedTuple):
+    file: str
+    track: Optional[parse_fit_file.ParsedTrack]
+    # why the file couldn't be parsed, None if it was
+    error: Optional[str]
+
+
+class StagedBatch(NamedTuple):
+    """
+    Rows of TRACKS_BULK_SIZE tracks prepared to be written.
+    """
+
+    tracks: tuple[Track, ...]
+    statistics: List[Statistic]
+    statistic_model_fields: List[str]
+    manifest: List[TrackFile]
+
+
+def hash_file(file: Path) -> str:
+    with open(file, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def parse_track_file(track_file: Path, points_file: Path) -> ParseResult:
+    """
+    Returns the track parsed in a single pass with its points columns, which
+    are saved to the points file. Errors are returned, so one broken file
+    doesn't stop the others. Module level function, so process pools can
+    pickle it.
+    """
+    try:
+        track, points = track_formats.parse_track_points(track_file)
+        track_points.save(points_file, points)
+    except Exception as e:
+        return ParseResult(track_file.name, None, str(e))
+
+    return ParseResult(track_file.name, track, None)
+
+
+def parse_many(
+    track_files, points_files, workers=None, executor="process"
+) -> Iterator[ParseResult]:
+    """
+    Yields a result per file in the order of the files, failures included.
+    Workers None means the number of CPUs, 1 parses in the calling process.
+    At most TRACKS_BULK_SIZE files are parsed ahead of the consumer.
+    """
+    if workers == 1 or len(track_files) < 2:
+        yield from map(parse_track_file, track_files, points_files)
+        return
+
+    with EXECUTORS[executor](max_workers=workers) as pool:
+        for batch in batched(zip(track_files, points_files), settings.TRACKS_BULK_SIZE):
+            yield from pool.map(parse_track_file, *zip(*batch))
+
 
 class TracksServiceData:
     def __init__(self, trip: Trip = None) -> List[str]:
         self.trip = trip or get_trip()
         self.tracks_db = self.get_tracks()
-        self.tracks_disk = self.get_files()
+        self.track_files = self.get_files()
+        self.tracks_disk = set(self.track_files)
 
     def get_tracks(self) -> Dict:
-        return self.trip.tracks.values("pk", "title", "date", "path")
+        # paths are not needed to tell which files are new or changed
+        return self.trip.tracks.values("pk", "title", "date")
 
-    def get_files(self) -> Set[str]:
+    def get_files(self) -> Dict[str, Path]:
         directory = Path(settings.MEDIA_ROOT) / "tracks" / str(self.trip.pk)
 
         if not directory.exists():
-            return set()
+            return {}
 
-        return {file.stem for file in directory.glob("*.fit")}
+        return track_formats.get_files(directory)
 
 
 class TracksService:
@@ -43,38 +118,139 @@ class TracksService:
 
         self.tracks_disk = data.tracks_disk
 
+        try:
+            self.track_files = data.track_files
+        except AttributeError:
+            self.track_files = {}
+
+        # results of the files which couldn't be parsed
+        self.parse_errors = []
+
     def new_tracks(self) -> Set[str]:
         return self.tracks_disk - self.tracks_db
 
+    def _track_file(self, track) -> Path:
+        if track in self.track_files:
+            return self.track_files[track]
+
+        return Path(settings.MEDIA_ROOT) / "tracks" / str(self.trip.pk) / f"{track}.fit"
+
+    def changed_tracks(self, track_list) -> Set[str]:
+        """
+        Returns tracks whose files changed since they were parsed,
+        were parsed by an older parser or are not in the database.
+        """
+        manifest = {
+            obj.name: obj
+            for obj in TrackFile.objects.filter(trip=self.trip, name__in=track_list)
+        }
+
+        changed = set()
+        touched = []
+        for track in track_list:
+            known = manifest.get(track)
+            file = self._track_file(track)
+
+            try:
+                stat = file.stat()
+            except OSError:
+                changed.add(track)
+                continue
+
+            if (
+                not known
+                or track not in self.tracks_db
+                or known.parser_version != parse_fit_file.PARSER_VERSION
+                or known.size != stat.st_size
+            ):
+                changed.add(track)
+            elif known.mtime != stat.st_mtime:
+                # copied or touched, the content could still be the same
+                if known.sha256 != hash_file(file):
+                    changed.add(track)
+                else:
+                    known.mtime = stat.st_mtime
+                    touched.append(known)
+
+        TrackFile.objects.bulk_update(touched, ["mtime"])
+
+        return changed
+
+    def _create_manifest(self, tracks) -> List[TrackFile]:
+        objects = []
+        for track in tracks:
+            file = self._track_file(track.title)
+
+            try:
+                stat = file.stat()
+                sha256 = hash_file(file)
+            except OSError:
+                continue
+
+            objects.append(
+                TrackFile(
+                    trip=self.trip,
+                    name=track.title,
+                    size=stat.st_size,
+                    mtime=stat.st_mtime,
+                    sha256=sha256,
+                    parser_version=parse_fit_file.PARSER_VERSION,
+                )
+            )
+
+        return objects
+
+    def _save_manifest(self, objects) -> None:
+        TrackFile.objects.bulk_create(
+            objects,
+            update_conflicts=True,
+            update_fields=["size", "mtime", "sha256", "parser_version"],
+            unique_fields=["trip", "name"],
+        )
+
+    def _remove_tracks(self, track_list) -> None:
+        """
+        Removes tracks whose files are gone from the disk.
+        """
+        if not track_list:
+            return
+
+        Track.objects.filter(trip=self.trip, title__in=track_list).delete()
+        TrackFile.objects.filter(trip=self.trip, name__in=track_list).delete()
+
+        # files can't be rolled back, they go once the rows are gone for good
+        titles = list(track_list)
+        transaction.on_commit(lambda: track_points.remove(self.trip.pk, titles))
+
     def _save_tracks(self, tracks) -> None:
+        # upsert keeps primary keys of the existing tracks
         Track.objects.bulk_create(
             tracks,
+            batch_size=settings.TRACKS_BULK_SIZE,
             update_conflicts=True,
-            update_fields=["date", "path"],
-            unique_fields=["pk"],
+            update_fields=["date", "path", "updated"],
+            unique_fields=["trip", "title"],
         )
 
-    def _create_tracks(self, track_list) -> List[Track]:
-        tracks = []
-        file_type = "fit"
+    def _create_tracks(self, track_list, staging: Path) -> Iterator[Track]:
+        # sorted, so the tracks are created in a repeatable order
+        track_list = sorted(track_list)
+        track_files = [self._track_file(track) for track in track_list]
+        points_files = [staging / f"{track}.npy" for track in track_list]
 
-        for track in track_list:
-            track_file = (
-                Path(settings.MEDIA_ROOT)
-                / "tracks"
-                / str(self.trip.pk)
-                / f"{track}.{file_type}"
-            )
-
-            path = parse_fit_file.get_track_path(track_file)
-            date = parse_fit_file.get_track_date(track_file)
+        results = parse_many(track_files, points_files, **settings.TRACKS_PARSE_POOL)
+        for track, result in zip(track_list, results):
+            if result.error:
+                self.parse_errors.append(result)
+                continue
 
+            parsed = result.track
             obj = Track(
                 title=track,
-                date=date,
-                activity_type="cycling",
+                date=parsed.date,
+                activity_type=parsed.activity_type,
                 trip=self.trip,
-                path=path,
+                path=parsed.path,
             )
 
             # If the track already exists in the database
@@ -82,10 +258,15 @@ class TracksService:
             if track in self.tracks_title_pk_map:
                 obj.pk = self.tracks_title_pk_map[track]
 
-            tracks.append(obj)
-        return tracks
+            yield obj
 
-    def _save_statistic(self, tracks) -> None:
+    def _create_statistic(
+        self, tracks, staging: Path
+    ) -> tuple[List[Statistic], List[str]]:
+        """
+        Returns statistic objects of the tracks and the fields they have,
+        computed with the points staged for them.
+        """
         objects = []
         statistic_model_fields = []
         for track in tracks:
@@ -93,49 +274,155 @@ class TracksService:
                 Path(settings.MEDIA_ROOT) / "tracks" / str(self.trip.pk) / track.title
             )
 
-            stats = parse_activity_file.get_statistic(activity_file)
+            # values missing from the Garmin summary are computed from the points
+            stats = points_statistic.fill_gaps(
+                parse_activity_file.get_statistic(activity_file),
+                points_statistic.get_statistic(
+                    track_points.load(staging / f"{track.title}.npy")
+                ),
+            )
             if not stats:
                 continue
 
-            obj = Statistic(track=track, **stats)
-            objects.append(obj)
+            objects.append(Statistic(track=track, **stats))
 
-            # if statistic_model_fields is empty,
-            # use the keys from the first stats dictionary
-            if not statistic_model_fields:
-                statistic_model_fields = list(stats.keys())
+            # summary and computed statistics can have different fields
+            statistic_model_fields = list(
+                dict.fromkeys([*statistic_model_fields, *stats])
+            )
+
+        return objects, statistic_model_fields
+
+    def _save_statistic(self, objects, statistic_model_fields, rebuild=False) -> bool:
+        """
+        Returns True if the trip totals have to be rebuilt,
+        otherwise the statistics are added to them.
+        """
+        # statistics being replaced can't be subtracted from the trip totals
+        tracks = [obj.track for obj in objects]
+        rebuild = rebuild or Statistic.objects.filter(track__in=tracks).exists()
 
         Statistic.objects.bulk_create(
             objects,
+            batch_size=settings.TRACKS_BULK_SIZE,
             update_conflicts=True,
             update_fields=statistic_model_fields,
             unique_fields=["track"],
         )
 
-    def _write_tracks(self, tracks) -> str:
+        if not rebuild:
+            statistic_service.add_trip_statistic(self.trip, objects)
+
+        return rebuild
+
+    def _stage_tracks(self, track_list, staging: Path, folder: Path) -> List[Path]:
+        """
+        Parses the tracks and prepares their rows outside of the transaction.
+        Batches are pickled to the folder, so memory doesn't grow with the size
+        of the trip. Returns the batch files in order.
+        """
+        files = []
+
+        tracks = self._create_tracks(track_list, staging)
+        for number, batch in enumerate(batched(tracks, settings.TRACKS_BULK_SIZE)):
+            statistics, statistic_model_fields = self._create_statistic(batch, staging)
+            staged = StagedBatch(
+                batch, statistics, statistic_model_fields, self._create_manifest(batch)
+            )
+
+            file = folder / f"{number}.pickle"
+            with open(file, "wb") as f:
+                pickle.dump(staged, f, protocol=pickle.HIGHEST_PROTOCOL)
+            files.append(file)
+
+        return files
+
+    def _read_batches(self, files) -> Iterator[StagedBatch]:
+        for file in files:
+            with open(file, "rb") as f:
+                yield pickle.load(f)
+
+    def _write_tracks(self, track_list, removed=frozenset()) -> str:
+        """
+        Tracks are parsed and staged before the transaction, only the batched
+        writes run in it, so locks are held just as long as they take. All
+        batches are written in one transaction, readers see either the
+        previous or the new tracks. Points files are moved in place once it
+        commits.
+        """
+        trip_pk = self.trip.pk
+        staging = track_points.create_staging(trip_pk) if track_list else None
+
+        # pickled batches are private to this process, never in MEDIA_ROOT
+        folder = Path(tempfile.mkdtemp(prefix="tracks-"))
+
         try:
-            self._save_tracks(tracks)
+            batches = self._stage_tracks(track_list, staging, folder) if staging else []
+
+            with transaction.atomic():
+                self._remove_tracks(removed)
+
+                rebuild = bool(removed)
+                dates = set()
+                written = 0
+                for staged in self._read_batches(batches):
+                    self._save_tracks(staged.tracks)
+                    written += len(staged.tracks)
+
+                    rebuild = self._save_statistic(
+                        staged.statistics, staged.statistic_model_fields, rebuild
+                    )
+                    dates |= {
+                        statistic_service.get_local_date(obj.track.date)
+                        for obj in staged.statistics
+                    }
+
+                    self._save_manifest(staged.manifest)
+
+                if rebuild:
+                    statistic_service.rebuild_trip_statistic(self.trip)
+                    statistic_service.update_daily_statistic(self.trip)
+                elif dates:
+                    statistic_service.update_daily_statistic(self.trip, dates)
+
+                # cached GeoJSON and statistics of the trip are stale from now on
+                if written or removed:
+                    self.trip.bump_cache_version()
+
+                if staging:
+                    transaction.on_commit(
+                        lambda: track_points.publish(staging, trip_pk)
+                    )
         except Exception as e:
+            if staging:
+                track_points.discard(staging)
             return f"Error occurred during saving tracks: {e}"
-        try:
-            self._save_statistic(tracks)
-        except Exception as e:
-            return f"Error occurred during saving statistic: {e}"
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+        msg = "Successfully created or updated tracks and statistics"
+        if self.parse_errors:
+            failed = ", ".join(f"{r.file} ({r.error})" for r in self.parse_errors)
+            msg = f"{msg}. Can't parse {failed}"
 
-        return "Successfully created or updated tracks and statistics"
+        return msg
 
     def create(self) -> tuple[str, int]:
         """
         Returns a tuple with a message and the number of new tracks created.
         """
         new_tracks = self.new_tracks()
-        tracks = self._create_tracks(new_tracks)
 
-        return (self._write_tracks(tracks), len(new_tracks))
+        return (self._write_tracks(new_tracks), len(new_tracks))
 
-    def create_or_update(self) -> tuple[str, int]:
+    def create_or_update(self, force=False) -> tuple[str, int]:
         """
-        Returns a tuple with a message and the number of new tracks created.
+        Returns a tuple with a message and the number of tracks created or updated.
+        Only files changed since the last parse are parsed again, unless forced.
         """
-        tracks = self._create_tracks(self.tracks_db | self.tracks_disk)
-        return (self._write_tracks(tracks), len(tracks))
+        track_list = (
+            self.tracks_disk if force else self.changed_tracks(self.tracks_disk)
+        )
+        removed = self.tracks_db - self.tracks_disk
+
+        return (self._write_tracks(track_list, removed), len(track_list))
@@ -1,30 +1,160 @@
 import contextlib
-import orjson
-import zlib
-from datetime import datetime
+import gzip
+import math
+import random
+import re
+import struct
+import time
 
+import numpy as np
+import orjson
 from django.conf import settings
+from django.contrib.gis.db.models.functions import GeomOutputGeoFunc
+from django.contrib.gis.geos import Polygon
 from django.core.cache import cache
+from django.db import connection
+from django.urls import reverse
+from redis.exceptions import LockError
 
 from .. import models
 from ..templatetags.datetime_filter import format_time
-from .statistic_service import get_statistic
+from . import statistic_service
+from .common import generate_cache_timeout, get_change_stamp
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
+# Same features as create_feature, built by PostgreSQL; one row per track
+FEATURES_SQL = """
+    SELECT
+        track.id,
+        json_build_object(
+            'type', 'Feature',
+            'geometry', COALESCE(
+                ST_AsGeoJSON(track.geom, %(precision)s)::json,
+                '{"type": "LineString", "coordinates": []}'::json
+            ),
+            'properties', json_build_object(
+                'total_km', COALESCE(round(track.total_km::numeric, 1), 0),
+                'date', to_char(track.date AT TIME ZONE 'UTC', 'YYYY-MM-DD'),
+                'time', CASE
+                    WHEN track.total_time_seconds IS NULL THEN to_json(0)
+                    ELSE to_json(format(
+                        '%%s:%%s:%%s',
+                        floor(track.total_time_seconds / 3600),
+                        lpad(floor(
+                            mod(track.total_time_seconds::numeric, 3600) / 60
+                        )::text, 2, '0'),
+                        lpad(floor(
+                            mod(track.total_time_seconds::numeric, 60)
+                        )::text, 2, '0')
+                    ))
+                END,
+                'avg_speed', COALESCE(round(track.avg_speed::numeric, 1), 0),
+                'ascent', COALESCE(round(track.ascent::numeric, 0), 0),
+                'last_point', CASE
+                    WHEN track.geom IS NOT NULL THEN json_build_array(
+                        round(ST_Y(ST_EndPoint(track.geom))::numeric, %(precision)s),
+                        round(ST_X(ST_EndPoint(track.geom))::numeric, %(precision)s)
+                    )
+                END
+            )
+        )::text
+    FROM (
+        SELECT
+            maps_track.id,
+            maps_track.date,
+            CASE
+                WHEN %(tolerance)s::float IS NULL THEN maps_track.path
+                ELSE ST_SimplifyPreserveTopology(maps_track.path, %(tolerance)s::float)
+            END AS geom,
+            stats.total_km,
+            stats.total_time_seconds,
+            stats.avg_speed,
+            stats.ascent
+        FROM maps_track
+        LEFT JOIN maps_statistic AS stats ON stats.track_id = maps_track.id
+        WHERE maps_track.id = ANY(%(tracks)s::int[])
+    ) AS track
+"""
 
-def generate_cache_key(trip):
+
+class CacheRebuildingError(Exception):
     """
-    Generates a unique cache key based on the trip's primary key.
+    GeoJSON is missing and another worker is still building it.
     """
-    return f"geojson_{trip.pk}"
 
 
-def generate_cache_timeout(trip):
-    current_date = datetime.now().date()
-    return (
-        settings.GEOJSON_CACHE_TIMEOUTS["ongoing_trip"]
-        if trip.start_date <= current_date <= trip.end_date
-        else settings.GEOJSON_CACHE_TIMEOUTS["past_trip"]
-    )
+class SimplifyPreserveTopology(GeomOutputGeoFunc):
+    function = "ST_SimplifyPreserveTopology"
+    arity = 2
+
+
+def get_detail_levels():
+    return list(settings.GEOJSON_DETAIL_LEVELS)
+
+
+def generate_cache_key(trip, level=None):
+    """
+    Generates a unique cache key based on the trip's primary key and cache version.
+    Simplified levels of detail get their own key next to the full one.
+    """
+    key = f"geojson_{trip.pk}_v{trip.cache_version}"
+
+    if settings.GEOJSON_DETAIL_LEVELS.get(level):
+        return f"{key}_{level}"
+
+    return key
+
+
+def generate_stale_cache_key(trip, level=None):
+    """
+    Points to the cache key of the latest built GeoJSON, whatever its version.
+    """
+    key = f"geojson_stale_{trip.pk}"
+
+    if settings.GEOJSON_DETAIL_LEVELS.get(level):
+        return f"{key}_{level}"
+
+    return key
+
+
+def generate_feature_cache_key(track_pk, updated, level=None):
+    key = f"geojson_feature_{track_pk}_{get_change_stamp(updated)}"
+
+    if settings.GEOJSON_DETAIL_LEVELS.get(level):
+        return f"{key}_{level}"
+
+    return key
+
+
+def generate_manifest_cache_key(trip, level=None):
+    key = f"geojson_manifest_{trip.pk}_v{trip.cache_version}"
+
+    if settings.GEOJSON_DETAIL_LEVELS.get(level):
+        return f"{key}_{level}"
+
+    return key
+
+
+def get_tracks_version(trip):
+    """
+    Returns a version string and the latest change datetime of the trip's tracks.
+    Both change whenever the trip's cache version is bumped.
+    """
+    return f"{trip.pk}-{trip.cache_version}", trip.tracks_updated
+
+
+def get_geo_json_version(trip, level=None, encoding=None):
+    """
+    Returns a strong ETag and the Last-Modified datetime of the trip's GeoJSON.
+    Every content encoding is a separate representation with its own ETag.
+    """
+    version, updated = get_tracks_version(trip)
+
+    return f'"{version}-{level or ""}-{encoding or "identity"}"', updated
 
 
 def create_stats(track):
@@ -46,64 +176,398 @@ def create_stats(track):
     return properties
 
 
-def create_geo_dict(tracks):
-    geo = {"type": "FeatureCollection", "features": []}
+def path_array(path):
+    """
+    Returns (N, 2) array of path's longitudes and latitudes read straight
+    from its WKB buffer, without building a tuple per vertex.
+    """
+    if not path:
+        return np.empty((0, 2))
+
+    wkb = memoryview(path.wkb)
+    byteorder = "<" if wkb[0] == 1 else ">"
+    (size,) = struct.unpack_from(f"{byteorder}I", wkb, 5)
+    dims = 3 if path.hasz else 2
+
+    coords = np.frombuffer(wkb, dtype=f"{byteorder}f8", count=size * dims, offset=9)
+    coords = coords.reshape(size, dims)[:, :2]
+
+    return np.round(coords.astype(np.float64), settings.GEOJSON_COORDINATE_PRECISION)
+
 
-    for track in tracks:
-        # Prepare feature properties
-        properties = create_stats(track)
+def create_feature(track, path_field="path"):
+    # Prepare feature properties
+    properties = create_stats(track)
 
-        # Add last point coordinates
-        coords = track.path.coords if track.path else []
-        last_point = list(coords[-1]) if coords else None
-        if last_point:
-            properties["last_point"] = last_point[::-1]
+    # Add last point coordinates
+    coords = path_array(getattr(track, path_field))
+    if len(coords):
+        properties["last_point"] = coords[-1, ::-1].tolist()
 
-        # Create feature
-        feature = {
-            "type": "Feature",
-            "geometry": {
-                "type": "LineString",
-                "coordinates": track.path.coords if track.path else [],
-            },
-            "properties": properties,
-        }
-        geo["features"].append(feature)
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "LineString",
+            "coordinates": coords,
+        },
+        "properties": properties,
+    }
+
+
+def create_geo_dict(tracks, path_field="path"):
+    return {
+        "type": "FeatureCollection",
+        "features": [create_feature(track, path_field) for track in tracks],
+    }
+
+
+def get_tracks(tracks, level=None):
+    """
+    Returns tracks queryset and the name of the attribute holding their paths.
+    """
+    tracks = tracks.select_related("stats")
+
+    # simplify geometries in the database, so only the reduced paths are fetched
+    if tolerance := settings.GEOJSON_DETAIL_LEVELS.get(level):
+        path_field = "simplified_path"
+        tracks = tracks.annotate(
+            **{path_field: SimplifyPreserveTopology("path", tolerance)}
+        ).defer("path")
 
-    return geo
+        return tracks, path_field
 
+    return tracks, "path"
+
+
+def create_features_in_db(track_pks, level=None):
+    params = {
+        "tracks": list(track_pks),
+        "tolerance": settings.GEOJSON_DETAIL_LEVELS.get(level),
+        "precision": settings.GEOJSON_COORDINATE_PRECISION,
+    }
+
+    with connection.cursor() as cursor:
+        cursor.execute(FEATURES_SQL, params)
+        return {pk: feature.encode("utf-8") for pk, feature in cursor.fetchall()}
+
+
+def create_features(track_pks, level=None):
+    """
+    Returns serialized features of the given tracks as {track_pk: bytes}.
+    """
+    if settings.GEOJSON_GENERATION == "database":
+        return create_features_in_db(track_pks, level)
+
+    tracks, path_field = get_tracks(
+        models.Track.objects.filter(pk__in=track_pks), level
+    )
+
+    return {
+        track.pk: orjson.dumps(
+            create_feature(track, path_field),
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY,
+        )
+        for track in tracks
+    }
+
+
+def get_manifest(trip, level=None):
+    """
+    Returns [(track_pk, feature_cache_key), ...] of the trip ordered by date.
+    """
+    cache_key = generate_manifest_cache_key(trip, level)
+
+    if (manifest := cache.get(cache_key)) is not None:
+        return manifest
 
-def create_geo_json(trip):
     tracks = (
-        models.Track.objects.filter(trip=trip).order_by("date").select_related("stats")
+        models.Track.objects.filter(trip=trip)
+        .order_by("date")
+        .values_list("pk", "updated")
     )
-    return orjson.dumps(
-        create_geo_dict(tracks), option=orjson.OPT_PASSTHROUGH_DATETIME
-    ).decode("utf-8")
+    manifest = [
+        (pk, generate_feature_cache_key(pk, updated, level)) for pk, updated in tracks
+    ]
 
+    cache.set(key=cache_key, value=manifest, timeout=generate_cache_timeout(trip))
 
-def set_cache(trip, cache_key=None, cache_timeout=None):
-    if not cache_key:
-        cache_key = generate_cache_key(trip)
+    return manifest
+
+
+def assemble_geo_json(manifest, level=None):
+    """
+    Assembles FeatureCollection from cached features,
+    only features missing in the cache are serialized.
+    """
+    features = cache.get_many([key for _, key in manifest])
+
+    if missing := [(pk, key) for pk, key in manifest if key not in features]:
+        created = create_features([pk for pk, _ in missing], level)
+        created = {key: created[pk] for pk, key in missing if pk in created}
+
+        cache.set_many(created, timeout=settings.GEOJSON_CACHE_TIMEOUTS["feature"])
+        features |= created
+
+    return (
+        b'{"type":"FeatureCollection","features":['
+        + b",".join(features[key] for _, key in manifest if key in features)
+        + b"]}"
+    )
+
+
+def create_geo_json(trip, level=None):
+    return assemble_geo_json(get_manifest(trip, level), level)
+
+
+def parse_bbox(value):
+    """
+    Returns Polygon of 'min_lon,min_lat,max_lon,max_lat' string
+    or None if the string is not a valid bounding box.
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = map(float, value.split(","))
+    except (AttributeError, ValueError):
+        return None
+
+    # float() takes "nan" and "inf" too
+    if not all(map(math.isfinite, (min_lon, min_lat, max_lon, max_lat))):
+        return None
+
+    if min_lon >= max_lon or min_lat >= max_lat:
+        return None
+
+    bbox = Polygon.from_bbox((min_lon, min_lat, max_lon, max_lat))
+    bbox.srid = 4326
+
+    return bbox
+
+
+def is_bbox_allowed(bbox):
+    """
+    Whether the bounding box of all trips is small enough to be served.
+    """
+    return bbox.area <= settings.BBOX_LIMITS["max_area"]
+
+
+def create_bbox_geo_json(bbox, trip=None, level=None, limit=None):
+    """
+    Returns GeoJSON of tracks intersecting the bounding box,
+    of the given trip or of all trips. None if there are more tracks
+    than the limit.
+    """
+    # path && bbox, backed by the GiST index on maps_track.path
+    tracks = models.Track.objects.filter(path__bboverlaps=bbox)
+    if trip:
+        tracks = tracks.filter(trip=trip)
+
+    tracks = tracks.order_by("date").values_list("pk", "updated")
+    if limit:
+        # one more row tells whether the limit is exceeded
+        tracks = tracks[: limit + 1]
+
+    manifest = [
+        (pk, generate_feature_cache_key(pk, updated, level)) for pk, updated in tracks
+    ]
+    if limit and len(manifest) > limit:
+        return None
+
+    return assemble_geo_json(manifest, level)
+
+
+def encode(data: bytes) -> dict:
+    """
+    Returns {content_encoding: bytes} of the data,
+    brotli is added only if the library is installed.
+    """
+    encoded = {"gzip": gzip.compress(data, mtime=0)}
+
+    if brotli:
+        encoded["br"] = brotli.compress(data)
 
-    if cached_data := cache.get(cache_key):
-        return zlib.decompress(cached_data).decode("utf-8")
+    return encoded
 
-    geo_data = create_geo_json(trip)
+
+def decode(encoded: dict) -> bytes:
+    return gzip.decompress(encoded["gzip"])
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """
+    Returns the best content encoding accepted by the client,
+    None means the payload has to be sent uncompressed.
+    """
+    available = ("br", "gzip") if brotli else ("gzip",)
+
+    for encoding in available:
+        if re.search(rf"\b{encoding}\b", accept_encoding):
+            return encoding
+
+    return None
+
+
+def build_cache(trip, cache_key, cache_timeout=None, level=None):
+    """
+    Builds and caches trip's GeoJSON together with its build time and expiry,
+    which drive the early refresh.
+    """
+    started = time.monotonic()
+    encoded = encode(create_geo_json(trip, level))
+    delta = time.monotonic() - started
+
+    timeout = cache_timeout or generate_cache_timeout(trip)
 
     cache.set(
         key=cache_key,
-        value=zlib.compress(geo_data.encode("utf-8")),
-        timeout=cache_timeout or generate_cache_timeout(trip),
+        value={
+            "data": encoded,
+            "delta": delta,
+            "expiry": time.time() + timeout if timeout else None,
+        },
+        timeout=timeout,
+    )
+    cache.set(key=generate_stale_cache_key(trip, level), value=cache_key, timeout=None)
+
+    return encoded
+
+
+def is_expiring(cached):
+    """
+    Probabilistic early expiration: the closer the expiry and the slower
+    the build, the more likely a request refreshes the value ahead of time.
+    """
+    if not cached["expiry"]:
+        return False
+
+    beta = settings.GEOJSON_REBUILD["beta"]
+    gap = -cached["delta"] * beta * math.log(1 - random.random())
+
+    return time.time() + gap >= cached["expiry"]
+
+
+def get_stale(trip, cache_key, level=None):
+    stale_key = cache.get(generate_stale_cache_key(trip, level))
+    if not stale_key or stale_key == cache_key:
+        return None
+
+    if cached := cache.get(stale_key):
+        return cached["data"]
+
+    return None
+
+
+def wait_for_cache(cache_key):
+    deadline = time.monotonic() + settings.GEOJSON_REBUILD["wait"]
+
+    while time.monotonic() < deadline:
+        time.sleep(settings.GEOJSON_REBUILD["poll_interval"])
+
+        if cached := cache.get(cache_key):
+            return cached["data"]
+
+    return None
+
+
+def build_locked(lock, trip, cache_key, cache_timeout=None, level=None):
+    try:
+        return build_cache(trip, cache_key, cache_timeout, level)
+    finally:
+        # the lock could have expired during a slow build
+        with contextlib.suppress(LockError):
+            lock.release()
+
+
+def set_cache(trip, cache_key=None, cache_timeout=None, level=None):
+    """
+    Returns trip's GeoJSON as ({content_encoding: bytes}, is_fresh), the same
+    precompressed bytes are kept in the cache and sent to the clients.
+
+    Only the worker holding the lock rebuilds a missing value, the others get
+    the previous version (is_fresh=False) or wait for the rebuilt one.
+    Raises CacheRebuildingError if the value is still missing after the wait.
+    """
+    if not cache_key:
+        cache_key = generate_cache_key(trip, level)
+
+    cached = cache.get(cache_key)
+    if cached and not is_expiring(cached):
+        return cached["data"], True
+
+    # caches without locks (local memory, dummy) rebuild in every worker
+    if not hasattr(cache, "lock"):
+        return build_cache(trip, cache_key, cache_timeout, level), True
+
+    lock = cache.lock(
+        f"{cache_key}_lock", timeout=settings.GEOJSON_REBUILD["lock_timeout"]
     )
+    if lock.acquire(blocking=False):
+        return build_locked(lock, trip, cache_key, cache_timeout, level), True
+
+    # refreshed early by another worker, the cached value is still valid
+    if cached:
+        return cached["data"], True
+
+    if stale := get_stale(trip, cache_key, level):
+        return stale, False
+
+    if rebuilt := wait_for_cache(cache_key):
+        return rebuilt, True
+
+    # the holder failed and released the lock, only one waiter takes it over
+    if lock.acquire(blocking=False):
+        return build_locked(lock, trip, cache_key, cache_timeout, level), True
+
+    raise CacheRebuildingError(cache_key)
+
+
+def refresh_cache(trip):
+    """
+    Builds trip's GeoJSON for the current cache version after its tracks were
+    written. Features of unchanged tracks are taken from the cache.
+    """
+    trip.refresh_from_db(fields=["cache_version", "tracks_updated"])
+
+    for level in get_detail_levels():
+        # being rebuilt by another worker already
+        with contextlib.suppress(CacheRebuildingError):
+            set_cache(trip, level=level)
+
+
+def is_cached(trip):
+    """
+    Whether GeoJSON of every level of detail and the statistic
+    of the trip's current cache version are in the cache.
+    """
+    keys = [generate_cache_key(trip, level) for level in get_detail_levels()]
+    keys.append(statistic_service.generate_cache_key(trip))
+
+    return len(cache.get_many(keys)) == len(keys)
+
+
+def warm_cache(trip):
+    """
+    Rebuilds trip's GeoJSON of every level of detail and its statistic,
+    whether they are cached or not.
+    """
+    for level in get_detail_levels():
+        build_cache(trip, generate_cache_key(trip, level), level=level)
+
+    statistic_service.set_statistic(trip)
+
+
+def get_geo_json_urls(trip):
+    """
+    Returns {level: url} of the trip's GeoJSON, from the coarsest to the finest.
+    """
+    url = reverse("maps:tracks_geojson", kwargs={"trip": trip.slug})
 
-    return geo_data
+    return {level: f"{url}?level={level}" for level in get_detail_levels()}
 
 
 def create_context(trip):
     return {
         "trip": trip,
-        "statistic": get_statistic(trip),
+        "statistic": statistic_service.get_statistic(trip),
         "google_api_key": settings.ENV["GOOGLE_API_KEY"],
-        "tracks": set_cache(trip),
+        "geojson_urls": get_geo_json_urls(trip),
+        "bbox_url": reverse("maps:trip_bbox", kwargs={"trip": trip.slug}),
     }
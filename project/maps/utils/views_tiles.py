@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.urls import reverse
+
+from .common import generate_cache_timeout
+from .views_map import get_tracks_version
+
+MAX_ZOOM = 22
+
+# Tracks are filtered with the GiST index on maps_track.path,
+# then clipped and quantized to the tile grid by PostGIS
+TILE_SQL = """
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom
+    ),
+    tile AS (
+        SELECT
+            ST_AsMVTGeom(ST_Transform(track.path, 3857), bounds.geom) AS geom,
+            track.id,
+            to_char(track.date AT TIME ZONE 'UTC', 'YYYY-MM-DD') AS date
+        FROM maps_track AS track, bounds
+        WHERE
+            track.trip_id = %(trip)s
+            AND track.path && ST_Transform(bounds.geom, 4326)
+    )
+    SELECT ST_AsMVT(tile, 'tracks') FROM tile WHERE tile.geom IS NOT NULL
+"""
+
+
+def is_valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2**z and 0 <= y < 2**z
+
+
+def generate_cache_key(trip, version, z, x, y):
+    return f"mvt_{trip.pk}_{version}_{z}_{x}_{y}"
+
+
+def create_tile(trip, z, x, y):
+    with connection.cursor() as cursor:
+        cursor.execute(TILE_SQL, {"z": z, "x": x, "y": y, "trip": trip.pk})
+        row = cursor.fetchone()
+
+    return bytes(row[0]) if row and row[0] else b""
+
+
+def get_tile(trip, version, z, x, y):
+    cache_key = generate_cache_key(trip, version, z, x, y)
+
+    tile = cache.get(cache_key)
+    if tile is None:
+        tile = create_tile(trip, z, x, y)
+        cache.set(
+            key=cache_key,
+            value=tile,
+            timeout=generate_cache_timeout(trip),
+        )
+
+    return tile
+
+
+def get_tiles_url(trip):
+    """
+    Returns url template for the Leaflet.VectorGrid layer.
+    Version in the query string lets browsers keep tiles of finished trips forever.
+    """
+    version, _ = get_tracks_version(trip)
+
+    url = reverse("maps:tiles", kwargs={"trip": trip.slug, "z": 0, "x": 0, "y": 0})
+    url = url.replace("/0/0/0.mvt", "/{z}/{x}/{y}.mvt")
+
+    return f"{url}?v={version}"
+
+
+def create_context(trip):
+    # small trips are light enough for the GeoJSON levels of detail
+    if trip.tracks.count() <= settings.MVT_TRACKS_THRESHOLD:
+        return {"tiles_url": None}
+
+    return {"tiles_url": get_tiles_url(trip)}
@@ -1,11 +1,19 @@
+from django.conf import settings
 from django.contrib.auth import logout
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
 from django.urls.base import reverse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date
 from django_htmx.http import retarget
-from vanilla import FormView, ListView, TemplateView
+from vanilla import FormView, ListView, TemplateView, View
 
 from . import forms, models
 from .mixins.views import (
@@ -13,7 +21,17 @@ from .mixins.views import (
     UpdateViewMixin,
     rendered_content,
 )
-from .utils import views_map, views_posts, wp_comments_qty, wp_content
+from .utils import (
+    freeze_service,
+    profile_service,
+    statistic_service,
+    views_map,
+    views_posts,
+    views_tiles,
+    wp_comments_qty,
+    wp_content,
+)
+from .utils.common import is_finished
 from .utils.garmin_service import GarminService
 from .utils.tracks_service import TracksService, TracksServiceData
 
@@ -28,11 +46,162 @@ class Map(TemplateView):
 
     def get_context_data(self, *args, **kwargs):
         trip = get_object_or_404(models.Trip, slug=self.kwargs.get("trip"))
-        context = views_map.create_context(trip)
+        context = (
+            views_map.create_context(trip)
+            | views_tiles.create_context(trip)
+            | freeze_service.create_context(trip)
+        )
 
         return super().get_context_data(*args, **kwargs) | context
 
 
+class TracksGeoJson(View):
+    def get(self, request, *args, **kwargs):
+        trip = get_object_or_404(models.Trip, slug=self.kwargs.get("trip"))
+
+        level = request.GET.get("level")
+        if level and level not in settings.GEOJSON_DETAIL_LEVELS:
+            raise Http404
+
+        encoding = views_map.choose_encoding(request.headers.get("Accept-Encoding", ""))
+        etag, last_modified = views_map.get_geo_json_version(trip, level, encoding)
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            try:
+                encoded, is_fresh = views_map.set_cache(trip, level=level)
+            except views_map.CacheRebuildingError:
+                # another worker is still building it, the client comes back
+                retry_after = settings.GEOJSON_REBUILD["retry_after"]
+                response = HttpResponse(status=503)
+                response.headers["Retry-After"] = str(retry_after)
+                patch_cache_control(response, no_store=True)
+                return response
+
+            # cached by a process without brotli, clients accepting br take gzip too
+            if encoding and encoding not in encoded:
+                encoding = "gzip"
+                etag, _ = views_map.get_geo_json_version(trip, level, encoding)
+
+            response = HttpResponse(
+                encoded[encoding] if encoding else views_map.decode(encoded),
+                content_type="application/geo+json",
+            )
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+
+            # previous version served while another worker rebuilds the current one
+            if not is_fresh:
+                patch_cache_control(response, no_store=True)
+                patch_vary_headers(response, ("Accept-Encoding",))
+                return response
+
+        # browsers keep the payload, but have to revalidate it on every visit
+        response.headers["ETag"] = etag
+        if last_modified:
+            response.headers["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, public=True, no_cache=True)
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        return response
+
+
+class BboxGeoJson(View):
+    def get(self, request, *args, **kwargs):
+        trip = None
+        if slug := self.kwargs.get("trip"):
+            trip = get_object_or_404(models.Trip, slug=slug)
+
+        level = request.GET.get("level")
+        if level and level not in settings.GEOJSON_DETAIL_LEVELS:
+            raise Http404
+
+        bbox = views_map.parse_bbox(request.GET.get("bbox"))
+        if not bbox:
+            return HttpResponseBadRequest("bbox=min_lon,min_lat,max_lon,max_lat")
+
+        # a trip is bounded by its own tracks, all trips are not
+        limit = None
+        if not trip:
+            if not views_map.is_bbox_allowed(bbox):
+                return HttpResponseBadRequest("bbox is too large")
+            limit = settings.BBOX_LIMITS["max_tracks"]
+
+        data = views_map.create_bbox_geo_json(bbox, trip, level, limit)
+        if data is None:
+            return HttpResponseBadRequest("Too many tracks in the bbox")
+
+        return HttpResponse(data, content_type="application/geo+json")
+
+
+class DailyStatistic(View):
+    def get(self, request, *args, **kwargs):
+        trip = get_object_or_404(models.Trip, slug=self.kwargs.get("trip"))
+
+        return HttpResponse(
+            statistic_service.get_daily_statistic(trip),
+            content_type="application/json",
+        )
+
+
+class TripProfile(View):
+    def get(self, request, *args, **kwargs):
+        trip = get_object_or_404(models.Trip, slug=self.kwargs.get("trip"))
+        points = profile_service.get_points(request.GET.get("points"))
+
+        return HttpResponse(
+            profile_service.get_trip_profile(trip, points),
+            content_type="application/json",
+        )
+
+
+class TrackProfile(View):
+    def get(self, request, *args, **kwargs):
+        track = get_object_or_404(
+            models.Track.objects.select_related("stats"),
+            pk=self.kwargs.get("pk"),
+            trip__slug=self.kwargs.get("trip"),
+        )
+        points = profile_service.get_points(request.GET.get("points"))
+
+        return HttpResponse(
+            profile_service.get_track_profile(track, points),
+            content_type="application/json",
+        )
+
+
+class TracksTile(View):
+    def get(self, request, *args, **kwargs):
+        trip = get_object_or_404(models.Trip, slug=self.kwargs.get("trip"))
+
+        z, x, y = self.kwargs.get("z"), self.kwargs.get("x"), self.kwargs.get("y")
+        if not views_tiles.is_valid_tile(z, x, y):
+            raise Http404
+
+        version, _ = views_map.get_tracks_version(trip)
+        etag = f'"{version}-{z}-{x}-{y}"'
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(
+                views_tiles.get_tile(trip, version, z, x, y),
+                content_type="application/vnd.mapbox-vector-tile",
+            )
+
+        response.headers["ETag"] = etag
+        if is_finished(trip) and request.GET.get("v") == version:
+            patch_cache_control(
+                response, public=True, max_age=31536000, immutable=True
+            )
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+
+        return response
+
+
 class Posts(TemplateView):
     template_name = "maps/posts.html"
 
@@ -149,23 +318,41 @@ class SaveNewTracks(LoginRequiredMixin, TemplateView):
         trip = get_object_or_404(models.Trip, slug=self.kwargs.get("trip"))
 
         data = TracksServiceData(trip)
-        msg, _ = TracksService(data).create()
+        msg, track_qty = TracksService(data).create()
+        if track_qty > 0:
+            views_map.refresh_cache(trip)
+
         context = {"message": msg}
 
         return super().get_context_data(*args, **kwargs) | context
 
 
-class RewriteAllTracks(LoginRequiredMixin, TemplateView):
+class UpdateChangedTracks(LoginRequiredMixin, TemplateView):
     template_name = "maps/utils_messages.html"
 
     def get_context_data(self, *args, **kwargs):
         trip = get_object_or_404(models.Trip, slug=self.kwargs.get("trip"))
 
-        models.Track.objects.filter(trip=trip).delete()
-        models.Statistic.objects.filter(track__trip=trip).delete()
+        data = TracksServiceData(trip)
+        # only new files and files changed since they were parsed
+        msg, track_qty = TracksService(data).create_or_update()
+        if track_qty > 0:
+            views_map.refresh_cache(trip)
+
+        context = {"message": msg}
+
+        return super().get_context_data(*args, **kwargs) | context
+
+
+class RewriteAllTracks(LoginRequiredMixin, TemplateView):
+    template_name = "maps/utils_messages.html"
+
+    def get_context_data(self, *args, **kwargs):
+        trip = get_object_or_404(models.Trip, slug=self.kwargs.get("trip"))
 
         data = TracksServiceData(trip)
-        msg, _ = TracksService(data).create_or_update()
+        # tracks and statistics are replaced in one transaction
+        msg, _ = TracksService(data).create_or_update(force=True)
         context = {"message": msg}
 
         return super().get_context_data(*args, **kwargs) | context
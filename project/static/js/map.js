@@ -1,4 +1,14 @@
-function initMap(routes) {
+// Minimal zoom for each level of detail, the coarsest one is loaded first
+const DETAIL_MIN_ZOOM = [0, 9, 13];
+
+const MAIN_PATH_COLOR = 'blue'; // Default color for the main path
+const SECONDARY_PATH_COLOR = 'red'; // Default color for the secondary path
+
+
+function initMap(geojsonUrls, tilesUrl, bboxUrl) {
+    // {level: url} ordered from the coarsest to the finest level
+    const detailLevels = Object.keys(geojsonUrls);
+
     const map = L.map(
         'map',
         { zoomControl: true, fullscreenControl: true, }
@@ -35,64 +45,216 @@ function initMap(routes) {
     pegmanControl.addTo(map);
 
 
+    fetchRoutes(geojsonUrls[detailLevels[0]])
+        .then(routes => showRoutes(map, routes, geojsonUrls, detailLevels, tilesUrl, bboxUrl))
+        .catch(error => console.log("routes", error));
+}
+
+
+function fetchRoutes(url, params) {
+    if (params) {
+        url = `${url}?${new URLSearchParams(params)}`;
+    }
+    return fetch(url).then(response => response.json());
+}
+
+
+function showRoutes(map, routes, geojsonUrls, detailLevels, tilesUrl, bboxUrl) {
     // Initialize marker cluster group
     const markers = L.markerClusterGroup({
         maxClusterRadius: 40,
         disableClusteringAtZoom: 12
     });
 
-    const trackLayers = L.layerGroup();
-    let mainPathColor = 'blue'; // Default color for the main path
-    let secondaryPathColor = 'red'; // Default color for the secondary path
-    let pathColor = mainPathColor; // Start with blue
     let endPoint = [0, 0]; // To store the last valid endpoint for centering
 
     if (routes.features && routes.features.length > 0) {
         console.log("routest", routes.features);// Set map view to the first route
 
         routes.features.forEach((feature, index) => {
-            const coords = feature.geometry?.coordinates;
-            if (!coords || !Array.isArray(coords) || coords.length === 0 || !Array.isArray(coords[0])) {
+            if (!hasCoordinates(feature)) {
                 return; // Skip this feature
             }
 
-            // Cycle color based on last color
-            const currentColor = pathColor === mainPathColor ? secondaryPathColor : mainPathColor;
-            pathColor = currentColor; // Update last color for next iteration
-
-            const trackLayer = L.geoJSON(feature, {
-                style: (feature) => {
-                    return {
-                        color: pathColor, // Ensure valid color
-                        weight: 3,
-                        opacity: 0.9
-                    };
-                }
-            });
-
             endPoint = feature.properties.last_point;
 
-            let stats = feature.properties;
-            console.log("stats", stats);
-            let popupContent =
-                `<div class="popup">` +
-                `<p>${stats.date}</p>` +
-                `<table>` +
-                `<tr><td>Atstumas:</td><td><span>${stats.total_km || 'N/A'}</span> km</td></tr>` +
-                `<tr><td>Laikas:</td><td><span>${stats.time || 'N/A'}</span> val</td></tr>` +
-                `<tr><td>Vid. greitis:</td><td><span>${stats.avg_speed || 'N/A'}</span> km/h</td></tr>` +
-                `<tr><td>Į kalną:</td><td><span>${stats.ascent || 'N/A'}</span> m</td></tr>` +
-                `</table></div>`
-
-            trackLayer.bindPopup(popupContent);
-
-            const marker = L.marker(endPoint, { title: (feature.properties.name || 'Unnamed') + ' (End)' }).bindPopup(popupContent);
+            const marker = L.marker(endPoint, { title: (feature.properties.name || 'Unnamed') + ' (End)' }).bindPopup(createPopup(feature.properties));
 
             markers.addLayer(marker);
-            trackLayers.addLayer(trackLayer);
         });
     }
+
+    let trackLayers = createTrackLayers(routes);
     trackLayers.addTo(map);
     map.addLayer(markers);
     map.setView(endPoint, 14);
-}
\ No newline at end of file
+
+    // Big trips get detailed paths from vector tiles of the visible area only
+    if (tilesUrl) {
+        showTiles(map, trackLayers, tilesUrl);
+        return;
+    }
+
+    // Replace tracks with a finer level of detail when zooming in,
+    // the finest level is loaded only for the visible area, unless the trip
+    // is frozen into static files
+    const finestLevel = detailLevels.length - 1;
+    const levelLayers = [trackLayers];
+    let shownLevel = 0;
+    let visibleBounds = null;
+
+    const wantedLevel = () => {
+        let level = 0;
+        DETAIL_MIN_ZOOM.forEach((minZoom, index) => {
+            if (index <= finestLevel && map.getZoom() >= minZoom) {
+                level = index;
+            }
+        });
+        return level;
+    };
+
+    const showLevel = (level, layers) => {
+        map.removeLayer(levelLayers[shownLevel]);
+        levelLayers[level] = layers;
+        layers.addTo(map);
+        shownLevel = level;
+    };
+
+    const loadVisibleTracks = (level) => {
+        if (visibleBounds && visibleBounds.contains(map.getBounds())) {
+            if (levelLayers[level]) {
+                showLevel(level, levelLayers[level]);
+            }
+            return;
+        }
+
+        const bounds = map.getBounds().pad(1);
+        visibleBounds = bounds;
+
+        fetchRoutes(bboxUrl, { level: detailLevels[level], bbox: bounds.toBBoxString() })
+            .then(routes => {
+                // the map was moved to another area meanwhile
+                if (visibleBounds !== bounds) {
+                    return;
+                }
+
+                const layers = createTrackLayers(routes);
+                if (wantedLevel() === level) {
+                    showLevel(level, layers);
+                } else {
+                    levelLayers[level] = layers;
+                }
+            })
+            .catch(error => console.log("visible tracks", error));
+    };
+
+    const loadDetailLevel = () => {
+        const level = wantedLevel();
+
+        if (bboxUrl && level > 0 && level === finestLevel) {
+            loadVisibleTracks(level);
+            return;
+        }
+
+        if (levelLayers[level]) {
+            showLevel(level, levelLayers[level]);
+            return;
+        }
+
+        fetchRoutes(geojsonUrls[detailLevels[level]])
+            .then(routes => {
+                const layers = createTrackLayers(routes);
+                if (wantedLevel() === level) {
+                    showLevel(level, layers);
+                } else {
+                    levelLayers[level] = layers;
+                }
+            })
+            .catch(error => console.log("detail level", error));
+    };
+
+    map.on('moveend', loadDetailLevel);
+    loadDetailLevel();
+}
+
+
+function showTiles(map, trackLayers, tilesUrl) {
+    const tilesLayer = L.vectorGrid.protobuf(tilesUrl, {
+        vectorTileLayerStyles: {
+            tracks: (properties) => {
+                return {
+                    color: trackColor(properties),
+                    weight: 3,
+                    opacity: 0.9
+                };
+            }
+        },
+    });
+
+    // Coarse GeoJSON is enough for the overview, tiles take over when zooming in
+    const switchLayers = () => {
+        const detailed = map.getZoom() >= DETAIL_MIN_ZOOM[1];
+
+        if (detailed && !map.hasLayer(tilesLayer)) {
+            map.removeLayer(trackLayers);
+            tilesLayer.addTo(map);
+        } else if (!detailed && map.hasLayer(tilesLayer)) {
+            map.removeLayer(tilesLayer);
+            trackLayers.addTo(map);
+        }
+    };
+
+    map.on('zoomend', switchLayers);
+    switchLayers();
+}
+
+
+function hasCoordinates(feature) {
+    const coords = feature.geometry?.coordinates;
+    return coords && Array.isArray(coords) && coords.length > 0 && Array.isArray(coords[0]);
+}
+
+
+function createPopup(stats) {
+    return `<div class="popup">` +
+        `<p>${stats.date}</p>` +
+        `<table>` +
+        `<tr><td>Atstumas:</td><td><span>${stats.total_km || 'N/A'}</span> km</td></tr>` +
+        `<tr><td>Laikas:</td><td><span>${stats.time || 'N/A'}</span> val</td></tr>` +
+        `<tr><td>Vid. greitis:</td><td><span>${stats.avg_speed || 'N/A'}</span> km/h</td></tr>` +
+        `<tr><td>Į kalną:</td><td><span>${stats.ascent || 'N/A'}</span> m</td></tr>` +
+        `</table></div>`;
+}
+
+
+function trackColor(properties) {
+    // Alternate colors of consecutive days
+    const day = Math.floor(Date.parse(properties.date) / 86400000);
+    return day % 2 ? MAIN_PATH_COLOR : SECONDARY_PATH_COLOR;
+}
+
+
+function createTrackLayers(routes) {
+    const trackLayers = L.layerGroup();
+
+    (routes.features || []).forEach((feature) => {
+        if (!hasCoordinates(feature)) {
+            return; // Skip this feature
+        }
+
+        const trackLayer = L.geoJSON(feature, {
+            style: (feature) => {
+                return {
+                    color: trackColor(feature.properties),
+                    weight: 3,
+                    opacity: 0.9
+                };
+            }
+        });
+
+        trackLayer.bindPopup(createPopup(feature.properties));
+        trackLayers.addLayer(trackLayer);
+    });
+
+    return trackLayers;
+}